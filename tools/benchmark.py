@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# benchmark the conversion with a synthetic Kompendium (offline, without
+# "pdftohtml"), the corpus can be scaled to a multiple of the real size
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from xml.sax.saxutils import escape
+import zipfile
+
+import openpyxl
+
+from download_and_convert import create, parse_editions
+from lib.BSI import BSI, BSIFactory
+from lib.common import save_json_dict
+
+# Bausteinkategorien of the real Kompendium (with about 11 Bausteine each)
+CATEGORIES = {
+    'ISMS': 'Sicherheitsmanagement',
+    'ORP': 'Organisation und Personal',
+    'CON': 'Konzepte und Vorgehensweisen',
+    'OPS': 'Betrieb',
+    'DER': 'Detektion und Reaktion',
+    'APP': 'Anwendungen',
+    'SYS': 'IT-Systeme',
+    'IND': 'Industrielle IT',
+    'NET': 'Netze und Kommunikation',
+    'INF': 'Infrastruktur',
+}
+BAUSTEINE_PER_CATEGORY = 11
+ANFORDERUNGEN_PER_BAUSTEIN = (8, 26)
+GEFAEHRDUNGEN = 47
+# Gefährdungen per Baustein (the KRT lists only those of the Baustein,
+# the 2020 csv has room for 28 of them, 30 columns)
+GEFAEHRDUNGEN_PER_BAUSTEIN = (10, 28)
+ROLLEN = [
+    'IT-Betrieb',
+    'Benutzer',
+    'Fachverantwortliche',
+    'Haustechnik',
+    'Informationssicherheitsbeauftragte (ISB)',
+    'Planer',
+    'Datenschutzbeauftragte',
+]
+SCHUTZZIELE = ['C', 'I', 'A', 'CI', 'CIA', 'IA']
+NBSP = '\xa0'
+
+
+# outline and content of a converted PDF (like "pdftohtml" would write)
+def write_conversion(pdf: str, backend: str, links: list, texts: list) -> None:
+    prefix = os.path.splitext(pdf)[0]
+
+    if backend == 'xml':
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+                 '<pdf2xml producer="benchmark" version="0">',
+                 '<page number="1" position="absolute" top="0" left="0" '
+                 'height="842" width="595">']
+        for i, text in enumerate(texts):
+            lines.append('<text top="{}" left="0" width="500" height="12" '
+                         'font="0"><b>{}</b></text>'.format(i,
+                                                            escape(text)))
+        lines.append('</page>')
+        lines.append('<outline>')
+        for link in links:
+            lines.append('<item page="1">{}</item>'.format(escape(link)))
+        lines.append('</outline>')
+        lines.append('</pdf2xml>')
+        with open('{}.xml'.format(prefix), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+        return
+
+    with open('{}s.html'.format(prefix), 'w', encoding='utf-8') as f:
+        f.write('<html><body>{}</body></html>'.format(''.join(
+            '<a href="#{}">{}</a><br/>'.format(i, escape(x))
+            for i, x in enumerate(links))))
+    with open('{}-html.html'.format(prefix), 'w', encoding='utf-8') as f:
+        f.write('<html><body>{}</body></html>'.format(''.join(
+            '<p>{}</p>'.format(escape(x)) for x in texts)))
+
+
+# synthetic Kompendium: Bausteine with Anforderungen and KRT
+def get_corpus(scale: int, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    gefaehrdungen = ['G 0.{}'.format(i) for i in range(1, GEFAEHRDUNGEN + 1)]
+
+    bausteine = []
+    for cat in CATEGORIES:
+        for i in range(1, BAUSTEINE_PER_CATEGORY * scale + 1):
+            name = '{}.{}'.format(cat, i)
+            selected = set(rnd.sample(
+                gefaehrdungen, rnd.randint(*GEFAEHRDUNGEN_PER_BAUSTEIN)))
+            bau_gefaehrdungen = [x for x in gefaehrdungen if x in selected]
+            anforderungen = []
+            for j in range(1, rnd.randint(*ANFORDERUNGEN_PER_BAUSTEIN) + 1):
+                label = 'Anforderung {} von {} ({})'.format(
+                    j, name, rnd.choice('BSH'))
+                if rnd.random() < 0.5:
+                    label += ' [{}]'.format(', '.join(
+                        rnd.sample(ROLLEN, rnd.randint(1, 2))))
+                krt = {x: rnd.choice(SCHUTZZIELE) for x in bau_gefaehrdungen
+                       if rnd.random() < 0.3}
+                anforderungen.append(('{}.A{}'.format(name, j), label, krt))
+            bausteine.append({'name': name,
+                              'label': 'Baustein {}'.format(name),
+                              'rolle': rnd.choice(ROLLEN),
+                              'gefaehrdungen': bau_gefaehrdungen,
+                              'anforderungen': anforderungen})
+
+    return {'gefaehrdungen': gefaehrdungen, 'bausteine': bausteine}
+
+
+def write_krt_xlsx(bsi: BSI, corpus: dict) -> None:
+    # Anforderungen with a different name within KRT (Kompendium -> KRT)
+    fixes = bsi._get_krt_anforderung_fixes()
+
+    wb = openpyxl.Workbook(write_only=True)
+    for bau in corpus['bausteine']:
+        ws = wb.create_sheet(bsi._get_krt_sheet_name(bau['name']))
+        ws.append([bau['name'], '', 'CIA'] + bau['gefaehrdungen'])
+        for anf_name, _, krt in bau['anforderungen']:
+            schutzziele = ''.join(sorted(set(''.join(krt.values()))))
+            ws.append([fixes.get(anf_name, anf_name), '', schutzziele] +
+                      ['X' if x in krt else ''
+                       for x in bau['gefaehrdungen']])
+    wb.save(bsi.krt_xlsx)
+
+
+# KRT of 2020 (csv with two digit Anforderungen and Gefährdungen,
+# every row has as many fields as the Baustein has Gefährdungen)
+def write_krt_csv(bsi: BSI, corpus: dict) -> None:
+    lines = ['']
+    for bau in corpus['bausteine']:
+        lines.append(';'.join([bau['name'], 'CIA'] + [
+            'G 0.{:02d}'.format(int(x.split('.')[1]))
+            for x in bau['gefaehrdungen']]))
+        for anf_name, _, krt in bau['anforderungen']:
+            bau_name, number = anf_name.split('.A')
+            schutzziele = ''.join(sorted(set(''.join(krt.values()))))
+            lines.append(';'.join(
+                ['{}.A{:02d}'.format(bau_name, int(number)), schutzziele] +
+                ['X' if x in krt else '' for x in bau['gefaehrdungen']]))
+        lines.append(';' * (len(bau['gefaehrdungen']) + 1))
+    with open(bsi.krt_csv, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+# write all files of an edition into the tmp dir of bsi, as if they were
+# downloaded, extracted and converted before
+def write_corpus(bsi: BSI, corpus: dict) -> None:
+    overview = ['<html><body><div class="l-content-wrapper">']
+    for cat, label in CATEGORIES.items():
+        overview.append('<h2>{}: {}</h2>'.format(cat, label))
+    if bsi.VERSION in ['2022', '2023']:
+        overview.append('<h2>Ähnliche Themen</h2>')
+
+    os.makedirs(bsi.baustein_dir, exist_ok=True)
+    pdfs = [bsi.gefaerdungen_pdf]
+    for bau in corpus['bausteine']:
+        filename = '{}_Baustein_Edition_{}'.format(
+            bau['name'].replace('.', '_'), bsi.VERSION)
+        overview.append('<p><a href="/{}.pdf">{}</a></p>'.format(
+            filename, filename))
+        pdfs.append(os.path.join(bsi.baustein_dir,
+                                 '{}.pdf'.format(filename)))
+    overview.append('</div></body></html>')
+    with open(bsi.overview_html, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(overview))
+
+    # the PDFs themselves are never read (only hashed)
+    for pdf in pdfs:
+        with open(pdf, 'wb') as f:
+            f.write('%PDF-1.4 {}'.format(os.path.basename(pdf)).encode())
+    if bsi.KOMPENDIUM_URL:
+        prefix = os.path.relpath(bsi.baustein_dir, bsi.baustein_dir_extract)
+        with zipfile.ZipFile(bsi.kompendium_zip, 'w') as zf:
+            for pdf in pdfs[1:]:
+                zf.write(pdf, os.path.normpath(
+                    os.path.join(prefix, os.path.basename(pdf))))
+
+    write_conversion(bsi.gefaerdungen_pdf, bsi.backend, [
+        '{} Gefährdung{}Nummer {}'.format(x, NBSP, x.split('.')[1])
+        for x in corpus['gefaehrdungen']], [])
+    for pdf, bau in zip(pdfs[1:], corpus['bausteine']):
+        links = ['IT-Grundschutz | {} {}'.format(
+            bau['name'], bau['label'].replace(' ', NBSP, 1))]
+        links += ['{} {}'.format(x[0], x[1]) for x in bau['anforderungen']]
+        texts = ['Grundsätzlich{}zuständig'.format(NBSP), bau['rolle']]
+        write_conversion(pdf, bsi.backend, links, texts)
+
+    if bsi.krt_csv:
+        write_krt_csv(bsi, corpus)
+    else:
+        write_krt_xlsx(bsi, corpus)
+
+    # remember the conversions, so no "pdftohtml" is needed
+    save_json_dict(bsi.conversion_cache, {
+        os.path.relpath(x, bsi.tmpdir): bsi._get_conversion_entry(
+            x, bsi._get_conversion_key(x, None)) for x in pdfs})
+
+
+def measure(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+
+    return time.perf_counter() - start, result
+
+
+def run(year: int, scale: int, workdir: str, options: dict) -> dict:
+    tmpdir = os.path.join(workdir, str(year), 'tmp')
+    data_dir = os.path.join(workdir, str(year), 'data')
+    os.makedirs(data_dir, exist_ok=True)
+
+    corpus = get_corpus(scale, seed=year)
+    write_corpus(BSIFactory.get_bsi_version(year, tmpdir=tmpdir, **options),
+                 corpus)
+
+    bsi = BSIFactory.get_bsi_version(year, tmpdir=tmpdir, **options)
+    t_setup, _ = measure(bsi.setup)
+    t_bausteine, _ = measure(bsi.get_bausteine_with_anforderungen)
+    anforderungen = [x[0] for bau in corpus['bausteine']
+                     for x in bau['anforderungen']]
+    t_krt, _ = measure(lambda: [bsi.get_gefaehrdungen_by_anforderung(x)
+                                for x in anforderungen])
+
+    # end to end with a fresh instance
+    bsi = BSIFactory.get_bsi_version(year, tmpdir=tmpdir, **options)
+    t_create, _ = measure(create, bsi, False, False, data_dir)
+
+    return {'edition': year,
+            'scale': scale,
+            'bausteine': len(corpus['bausteine']),
+            'anforderungen': len(anforderungen),
+            'setup': t_setup,
+            'get_bausteine_with_anforderungen': t_bausteine,
+            'get_gefaehrdungen_by_anforderung': t_krt,
+            'create': t_create,
+            'stats': bsi.stats.to_dict()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Benchmark the conversion with a synthetic Kompendium')
+    parser.add_argument(
+        '--editions',
+        type=parse_editions,
+        default=list(BSIFactory.VERSIONS),
+        help='comma separated list of editions (default: all)')
+    parser.add_argument(
+        '--scales',
+        type=lambda x: [int(y) for y in x.split(',')],
+        default=[1, 2, 5, 10],
+        help='comma separated sizes of the corpus as multiples of the real '
+             'Kompendium (default: 1,2,5,10)')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='number of workers per edition (default: number of CPUs)')
+    parser.add_argument(
+        '--backend',
+        choices=['html', 'xml'],
+        default='html',
+        help='output format of pdftohtml to parse (default: html)')
+    parser.add_argument(
+        '--report',
+        help='write all results into this json file')
+    parser.add_argument(
+        '--keep',
+        action='store_true',
+        help='keep the generated files')
+    args = parser.parse_args()
+    # always parse, the benchmark measures the parsers
+    options = {'workers': args.workers,
+               'backend': args.backend,
+               'parse_cache': False}
+
+    print('{:>7} {:>5} {:>9} {:>13} {:>8} {:>9} {:>8} {:>8}'.format(
+        'edition', 'scale', 'bausteine', 'anforderungen',
+        'setup', 'bausteine', 'krt', 'create'))
+    results = []
+    for scale in args.scales:
+        for year in args.editions:
+            workdir = tempfile.mkdtemp(prefix='grundschutz-benchmark-')
+            try:
+                result = run(year, scale, workdir, options)
+            finally:
+                if args.keep:
+                    print('Files kept in {}'.format(workdir))
+                else:
+                    shutil.rmtree(workdir)
+            results.append(result)
+            print('{edition:>7} {scale:>5} {bausteine:>9} {anforderungen:>13} '
+                  '{setup:>8.3f} {get_bausteine_with_anforderungen:>9.3f} '
+                  '{get_gefaehrdungen_by_anforderung:>8.3f} '
+                  '{create:>8.3f}'.format(**result))
+
+    if args.report:
+        save_json_dict(args.report, {'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# compare two converted editions (data/<edition>/*.json) and
+# write the added, removed and changed records as json
+import argparse
+import json
+import os
+import sys
+
+from lib.common import (DATA_DIR, get_converted_editions, load_edition,
+                        save_json_dict)
+from lib.diff import diff_editions
+
+
+def main() -> None:
+    editions = get_converted_editions()
+    parser = argparse.ArgumentParser(
+        description='Compare two converted editions')
+    parser.add_argument(
+        'old',
+        choices=editions,
+        help='older edition')
+    parser.add_argument(
+        'new',
+        choices=editions,
+        help='newer edition')
+    parser.add_argument(
+        '-o', '--output',
+        help='write the changes into this file (default: stdout)')
+    args = parser.parse_args()
+
+    changes = {'old': args.old, 'new': args.new}
+    changes.update(diff_editions(
+        load_edition(os.path.join(DATA_DIR, args.old)),
+        load_edition(os.path.join(DATA_DIR, args.new))))
+
+    if args.output:
+        save_json_dict(args.output, changes)
+    else:
+        json.dump(changes, sys.stdout, ensure_ascii=False, indent=2,
+                  sort_keys=True)
+        print()
+
+    for name in ['baustein', 'anforderung', 'krt']:
+        print('{}: {} added, {} removed, {} changed'.format(
+            name, len(changes[name]['added']),
+            len(changes[name]['removed']), len(changes[name]['changed'])),
+            file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,46 @@
 #!/usr/bin/env python
 # download BSI IT-Grundschutz-Kompendium and
 # convert it into structural json based machine-readable data
-import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cProfile
+import itertools
 import os
-from pkg_resources import parse_version
 import re
 import shutil
-
-from jsonschema import validate
-
-from lib.common import get_from_json, save_json
-from lib.BSI import BSI, BSIFactory
-
-
-# return ID if data (based on a key) is found in json file,
-# if not, add to the given list and return ID
-def get_or_create(jsonfile: str,
-                  jsonlist: list,
-                  by: str,
-                  all_elems: dict) -> int:
-    try:
-        thisid = get_from_json(jsonfile, by, all_elems[by])
-    except ValueError:
-        thisid = len(jsonlist)
-        obj = {'id': thisid}
-        obj.update(all_elems)
-        jsonlist.append(obj)
-        save_json(jsonfile, jsonlist)
-
-    return thisid
-
-
-def create(bsi: BSI) -> None:
+import sys
+import time
+import traceback
+from typing import Iterable, Iterator, Optional
+
+from lib.common import (JSON_FORMATS, JsonRegistry, open_atomic,
+                        save_json_dict, version_key)
+from lib.BSI import BSI, BSIFactory, Baustein
+from lib.cache import ParseCache
+from lib.export import create_sqlite
+from lib.validation import check_references, validate_data
+
+
+# group streamed Bausteine by Bausteinkategorie (the last Baustein with
+# the same number wins), a Bausteinkategorie is handed over as soon as the
+# next one starts (files are parsed sorted by name, which starts with the
+# Bausteinkategorie, like APP_1_1_Office-Produkte_Edition_2023.pdf)
+def group_bausteine(bausteine: Iterable[Baustein]) -> Iterator[tuple]:
+    last = None
+    for kat, group in itertools.groupby(bausteine, lambda x: x.category):
+        if last is not None and kat <= last:
+            raise ValueError('Bausteinkategorie "{}" not in order (after '
+                             '"{}")'.format(kat, last))
+        yield kat, {x.number: x for x in group}
+        last = kat
+
+
+def create(bsi: BSI,
+           check_refs: bool = False,
+           sqlite: bool = False,
+           data_dir: Optional[str] = None,
+           formats: Iterable[str] = ('json',)) -> None:
     # download and convert
     bsi.setup()
 
@@ -39,8 +48,9 @@ def create(bsi: BSI) -> None:
         os.path.join(os.path.dirname(__file__), '..', 'schema'))
     template_dir = os.path.abspath(
         os.path.join(os.path.dirname(__file__), '..', 'template'))
-    data_dir = os.path.abspath(
-        os.path.join(os.path.dirname(__file__), '..', 'data', bsi.VERSION))
+    if data_dir is None:
+        data_dir = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), '..', 'data', bsi.VERSION))
     os.makedirs(data_dir, exist_ok=True)
 
     j_anforderung = os.path.join(data_dir, 'anforderung.json')
@@ -52,55 +62,50 @@ def create(bsi: BSI) -> None:
     j_rolle = os.path.join(data_dir, 'rolle.json')
     j_schutzziel = os.path.join(data_dir, 'schutzziel.json')
 
-    # copy over the static data
-    shutil.copy2(os.path.join(template_dir, 'anforderungstyp.json'), data_dir)
-    shutil.copy2(os.path.join(template_dir, 'schutzziel.json'), data_dir)
+    # copy over the static data (atomically, like all other files)
+    for name in ('anforderungstyp.json', 'schutzziel.json'):
+        with open(os.path.join(template_dir, name), 'rb') as src, \
+                open_atomic(os.path.join(data_dir, name)) as dest:
+            shutil.copyfileobj(src, dest)
 
     # get Gefährdungen
     bsigefaerdungen = bsi.get_gefaehrdungen()
     # get Bausteinkategorien
     bsibausteinkategorien = bsi.get_bausteinkategorien()
-    # get Bausteine and Anforderungen
-    bsielements = bsi.get_bausteine_with_anforderungen()
-
-    # define empty lists
-    d_anforderung = []
-    d_anf_gef = []
-    d_baustein = []
-    d_bausteinkat = []
-    d_gefaehrdung = []
-    d_rolle = []
-
-    # save those empty lists into json files
-    save_json(j_anforderung, d_anforderung)
-    save_json(j_anf_gef, d_anf_gef)
-    save_json(j_baustein, d_baustein)
-    save_json(j_bausteinkat, d_bausteinkat)
-    save_json(j_gefaehrdung, d_gefaehrdung)
-    save_json(j_rolle, d_rolle)
-
-    # loop through Bausteinkategorien (like APP/CON/...)
-    for kat in sorted(bsielements):
+
+    # define empty registries (kept in memory, saved once at the end)
+    d_anforderung = JsonRegistry(j_anforderung)
+    d_anf_gef = JsonRegistry(j_anf_gef)
+    d_baustein = JsonRegistry(j_baustein)
+    d_bausteinkat = JsonRegistry(j_bausteinkat)
+    d_gefaehrdung = JsonRegistry(j_gefaehrdung)
+    d_rolle = JsonRegistry(j_rolle)
+    # static data
+    d_anforderungstyp = JsonRegistry.from_json(j_anforderungstyp)
+    d_schutzziel = JsonRegistry.from_json(j_schutzziel)
+
+    # loop through Bausteinkategorien (like APP/CON/...) with their
+    # Bausteine and Anforderungen (compact records, streamed from the
+    # parser, only one Bausteinkategorie at a time)
+    for kat, bsielements in group_bausteine(bsi.iter_bausteine()):
         kat_data = {'name': kat,
                     'label': bsibausteinkategorien[kat]}
-        kat_id = get_or_create(j_bausteinkat, d_bausteinkat, 'name', kat_data)
-        for bauv in sorted(parse_version(x) for x in bsielements[kat]):
-            rolle_data = {'name': bsielements[kat][str(bauv)]['rolle']}
-            bau_rolle_id = get_or_create(j_rolle, d_rolle, 'name', rolle_data)
+        kat_id = d_bausteinkat.get_or_create(kat_data)
+        for bauv in sorted(bsielements, key=version_key):
+            baustein = bsielements[bauv]
+            rolle_data = {'name': baustein.rolle}
+            bau_rolle_id = d_rolle.get_or_create(rolle_data)
             baustein_data = {
                     'id': len(d_baustein),
-                    'name': bsielements[kat][str(bauv)]['name'],
-                    'label': bsielements[kat][str(bauv)]['label'],
+                    'name': baustein.name,
+                    'label': baustein.label,
                     'bausteinkategorie': kat_id,
                     'rolle': bau_rolle_id
             }
-            baustein_id = get_or_create(
-                j_baustein, d_baustein, 'name', baustein_data)
+            baustein_id = d_baustein.get_or_create(baustein_data)
 
-            for anfv in sorted(parse_version(x) for x in
-                               bsielements[kat][str(bauv)]['anforderungen']):
-                anf_label = bsielements[kat][str(bauv)][
-                    'anforderungen'][str(anfv)]['label']
+            for anfv in sorted(baustein.anforderungen, key=version_key):
+                anf_name, anf_label = baustein.anforderungen[anfv]
 
                 # examine label + type + reponsible (role)
                 # FIXME: in BSI 2023, different order of type / reposonsibility
@@ -120,8 +125,7 @@ def create(bsi: BSI) -> None:
                     # negative lookahead, split on ',' but not inside brackets
                     for entry in re.split(r',(?![^(]*\))', anf_rollen):
                         rolle_data = {'name': entry.strip()}
-                        rolle_id = get_or_create(
-                            j_rolle, d_rolle, 'name', rolle_data)
+                        rolle_id = d_rolle.get_or_create(rolle_data)
                         anf_rollen_ids.append(rolle_id)
 
                 found = re.search(r'(.*)\s\(([BSH])\)', anf_real_label)
@@ -139,78 +143,401 @@ def create(bsi: BSI) -> None:
                 elif 'H' == anf_typ.upper():
                     anf_typ = 'Hoch'
 
-                d_anforderung.append({
-                    'id': len(d_anforderung),
-                    'name': bsielements[kat][str(bauv)][
-                        'anforderungen'][str(anfv)]['name'],
+                d_anforderung.add({
+                    'name': anf_name,
                     'label': anf_real_label,
-                    'anforderungstyp':
-                        get_from_json(j_anforderungstyp, 'name', anf_typ),
+                    'anforderungstyp': d_anforderungstyp.get(anf_typ),
                     'baustein': baustein_id,
                     'rollen': anf_rollen_ids
                 })
 
-    # we dont need the id before, so only save it once!
-    save_json(j_anforderung, d_anforderung)
-
-    # get Gefährdungen and save them
-    for gefv in sorted(parse_version(x) for x in bsigefaerdungen):
-        d_gefaehrdung.append({
-            'id': len(d_gefaehrdung),
-            'name': bsigefaerdungen[str(gefv)]['name'],
-            'label': bsigefaerdungen[str(gefv)]['label'],
+    # get Gefährdungen and add them
+    for gefv in sorted(bsigefaerdungen, key=version_key):
+        d_gefaehrdung.add({
+            'name': bsigefaerdungen[gefv]['name'],
+            'label': bsigefaerdungen[gefv]['label'],
         })
 
-    save_json(j_gefaehrdung, d_gefaehrdung)
-
     # loop again over all Anforderungen and get a list of Gefährdungen
-    for anf in d_anforderung:
-        gef_per_anf = bsi.get_gefaehrdungen_by_anforderung(anf['name'])
-        for g in gef_per_anf:
-            g_data = {'name': g}
-            g_id = get_or_create(j_gefaehrdung, d_gefaehrdung, 'name', g_data)
-            s_ids = []
-            for schutzziel in gef_per_anf[g]:
-                schutzziel_id = get_from_json(j_schutzziel, 'name', schutzziel)
-                s_ids.append(schutzziel_id)
-            d_anf_gef.append({
-                'id': len(d_anf_gef),
-                'anforderung': anf['id'],
-                'gefaehrdung': g_id,
-                'schutzziele': s_ids
-            })
-
-    save_json(j_anf_gef, d_anf_gef)
-
-    for i in [j_anforderung,
-              j_anf_gef,
-              j_anforderungstyp,
-              j_baustein,
-              j_bausteinkat,
-              j_gefaehrdung,
-              j_rolle,
-              j_schutzziel]:
-        schema = os.path.join(
-            schema_dir, os.path.basename(i).replace('.json', '.schema.json'))
-
-        with open(i, 'r', encoding='utf-8') as f:
-            data = f.read()
-
-        with open(schema, 'r', encoding='utf-8') as f:
-            sdata = f.read()
-
-        validate(json.loads(data), json.loads(sdata))
+    krt_index = bsi.get_gefaehrdungen_by_anforderungen()
+    missing = [x['name'] for x in d_anforderung.elements
+               if x['name'] not in krt_index]
+    if len(missing) > 0:
+        raise ValueError('Anforderungen not found inside KRT: {}'
+                         .format(', '.join(missing)))
+    with bsi.stats.stage('mapping') as stage:
+        for anf in d_anforderung.elements:
+            gef_per_anf = krt_index[anf['name']]
+            for g in gef_per_anf:
+                g_data = {'name': g}
+                g_id = d_gefaehrdung.get_or_create(g_data)
+                s_ids = []
+                for schutzziel in gef_per_anf[g]:
+                    schutzziel_id = d_schutzziel.get(schutzziel)
+                    s_ids.append(schutzziel_id)
+                d_anf_gef.add({
+                    'anforderung': anf['id'],
+                    'gefaehrdung': g_id,
+                    'schutzziele': s_ids
+                })
+        stage['items'] = len(d_anf_gef)
+
+    registries = {'anforderung': d_anforderung,
+                  'anforderung_gefaehrdung': d_anf_gef,
+                  'anforderungstyp': d_anforderungstyp,
+                  'baustein': d_baustein,
+                  'bausteinkategorie': d_bausteinkat,
+                  'gefaehrdung': d_gefaehrdung,
+                  'rolle': d_rolle,
+                  'schutzziel': d_schutzziel}
+
+    # validate everything before writing anything
+    with bsi.stats.stage('validation') as stage:
+        for name, registry in registries.items():
+            validate_data(registry.elements,
+                          os.path.join(schema_dir,
+                                       '{}.schema.json'.format(name)))
+            stage['items'] += len(registry)
+        if check_refs:
+            check_references({name: registry.elements
+                              for name, registry in registries.items()})
+
+    # write all json files once (static data was copied already,
+    # only its other formats are written)
+    with bsi.stats.stage('serialization') as stage:
+        for registry in [d_anforderung,
+                         d_anf_gef,
+                         d_baustein,
+                         d_bausteinkat,
+                         d_gefaehrdung,
+                         d_rolle]:
+            registry.save(formats)
+            stage['items'] += len(registry)
+        for registry in [d_anforderungstyp, d_schutzziel]:
+            registry.save([x for x in formats if x != 'json'])
+
+        if sqlite:
+            data = {name: registry.elements
+                    for name, registry in registries.items()}
+            create_sqlite(os.path.join(data_dir, 'grundschutz.sqlite'),
+                          {bsi.VERSION: data})
+
+
+# build a single edition, return the stats and an error message if it
+# failed (runs in a separate process if several editions are built at once)
+def build(year: int,
+          check_refs: bool = False,
+          sqlite: bool = False,
+          profile_dir: Optional[str] = None,
+          formats: Iterable[str] = ('json',),
+          **kwargs) -> tuple:
+    bsi = None
+    profiler = cProfile.Profile() if profile_dir else None
+    try:
+        bsi = BSIFactory.get_bsi_version(year, **kwargs)
+        if profiler is not None:
+            profiler.enable()
+        create(bsi, check_refs, sqlite, formats=formats)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(
+                os.path.join(profile_dir, '{}.prof'.format(year)))
+
+    stats = bsi.stats.to_dict() if bsi is not None else {}
+
+    return stats, error
+
+
+# build editions in a process pool, results go into report and errors,
+# return the editions which failed because a process of the pool died
+def _build_in_pool(editions: list,
+                   jobs: int,
+                   pool_options: dict,
+                   options: dict,
+                   report: dict,
+                   errors: dict) -> list:
+    broken = []
+    with ProcessPoolExecutor(max_workers=jobs, **pool_options) as executor:
+        futures = {
+            year: executor.submit(build, year, **options)
+            for year in editions}
+        for year, future in futures.items():
+            try:
+                report[year], error = future.result()
+            except BrokenProcessPool:
+                # a process died (like killed because of too much memory),
+                # all editions which were not finished yet fail with it
+                broken.append(year)
+                continue
+            except Exception:
+                report[year] = {}
+                error = traceback.format_exc()
+            if error is not None:
+                errors[year] = error
+
+    return broken
+
+
+# build several editions (at the same time, see --jobs and --low-memory),
+# return the stats and the error messages per edition
+def build_all(editions: list,
+              jobs: Optional[int],
+              low_memory: bool,
+              options: dict) -> tuple:
+    pool_options = {}
+    if low_memory:
+        # a fresh process per edition gives all memory back afterwards
+        jobs = min(jobs or 1, len(editions))
+        pool_options['max_tasks_per_child'] = 1
+    else:
+        jobs = min(jobs or os.cpu_count() or 1, len(editions))
+    errors = {}
+    report = {}
+    if jobs <= 1 and not low_memory:
+        for year in editions:
+            report[year], error = build(year, **options)
+            if error is not None:
+                errors[year] = error
+        return report, errors
+
+    # share the CPUs between the editions built at the same time
+    if options.get('workers') is None:
+        options = dict(options,
+                       workers=max(1, (os.cpu_count() or 1) // jobs))
+    broken = _build_in_pool(editions, jobs, pool_options, options,
+                            report, errors)
+    # which edition killed the pool is unknown, build each one alone again
+    if len(broken) > 1:
+        retry = broken
+        broken = []
+        for year in retry:
+            broken += _build_in_pool([year], 1, pool_options, options,
+                                     report, errors)
+    for year in broken:
+        report[year] = {}
+        errors[year] = 'Process of edition {} died unexpectedly (like ' \
+                       'killed because of too much memory)'.format(year)
+
+    return {x: report[x] for x in editions}, errors
+
+
+# ask the server (ETag / Last-Modified) for changed source files of an
+# edition, changed files are downloaded, return their paths
+def check_sources(year: int, mirror: Optional[str] = None) -> list:
+    bsi = BSIFactory.get_bsi_version(year, mirror=mirror, parse_cache=False)
+
+    return bsi._download(check=True)
+
+
+# build all editions once, afterwards check the sources every interval
+# seconds and rebuild only the changed editions (failed editions too,
+# but only once their sources changed), unchanged extracted, converted
+# and parsed files are taken from the caches
+def watch(editions: list,
+          interval: float,
+          jobs: Optional[int],
+          low_memory: bool,
+          options: dict) -> None:
+    todo = list(editions)
+    try:
+        while True:
+            if len(todo) > 0:
+                print('Building editions: {}'.format(
+                    ', '.join(str(x) for x in todo)))
+                report, errors = build_all(todo, jobs, low_memory, options)
+                for year, error in errors.items():
+                    print('Edition {} failed:\n{}'.format(year, error),
+                          file=sys.stderr)
+                for year in todo:
+                    if year not in errors:
+                        print('Edition {}: {:.1f} s'.format(
+                            year, report[year]['wall_time']))
+                # failed editions are only built again with changed
+                # sources (a broken source would fail again anyway)
+                todo = []
+
+            time.sleep(interval)
+            for year in editions:
+                try:
+                    changed = check_sources(year, options.get('mirror'))
+                except Exception as e:
+                    # server not reachable, try again with the next check,
+                    # but files which were written anyway are up to date
+                    # now (not changed with the next check any more)
+                    print('Edition {}: check failed: {}'.format(year, e),
+                          file=sys.stderr)
+                    changed = getattr(e, 'changed', [])
+                if len(changed) > 0 and year not in todo:
+                    print('Edition {}: changed: {}'.format(
+                        year, ', '.join(os.path.basename(x)
+                                        for x in changed)))
+                    todo.append(year)
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_editions(value: str) -> list:
+    editions = []
+    for entry in value.split(','):
+        try:
+            year = int(entry.strip())
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                'invalid edition: {}'.format(entry))
+        if year not in BSIFactory.VERSIONS:
+            raise argparse.ArgumentTypeError(
+                'unknown edition: {} (available: {})'.format(
+                    year, ', '.join(str(x) for x in BSIFactory.VERSIONS)))
+        if year not in editions:
+            editions.append(year)
+
+    return editions
+
+
+def parse_formats(value: str) -> list:
+    formats = [x.strip() for x in value.split(',')]
+    for entry in formats:
+        if entry not in JSON_FORMATS:
+            raise argparse.ArgumentTypeError(
+                'unknown format: {} (available: {})'.format(
+                    entry, ', '.join(JSON_FORMATS)))
+    if 'json' not in formats:
+        raise argparse.ArgumentTypeError('format "json" is always needed')
+
+    return formats
 
 
 def main() -> None:
-    bsi2020 = BSIFactory.get_bsi_version(2020)
-    create(bsi2020)
-    bsi2021 = BSIFactory.get_bsi_version(2021)
-    create(bsi2021)
-    bsi2022 = BSIFactory.get_bsi_version(2022)
-    create(bsi2022)
-    bsi2023 = BSIFactory.get_bsi_version(2023)
-    create(bsi2023)
+    parser = argparse.ArgumentParser(
+        description='Download the BSI IT-Grundschutz-Kompendium and '
+                    'convert it into json')
+    parser.add_argument(
+        '--editions',
+        type=parse_editions,
+        default=list(BSIFactory.VERSIONS),
+        help='comma separated list of editions (default: all, {})'.format(
+            ','.join(str(x) for x in BSIFactory.VERSIONS)))
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='number of editions built at the same time, each in its own '
+             'process (default: number of CPUs)')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='number of workers per edition for converting and parsing '
+             '(default: number of CPUs divided by the number of editions '
+             'built at the same time)')
+    parser.add_argument(
+        '--serial',
+        action='store_true',
+        help='parse all files of an edition in a single process '
+             '(for debugging)')
+    parser.add_argument(
+        '--backend',
+        choices=['html', 'xml'],
+        default='html',
+        help='output format of pdftohtml to parse (default: html)')
+    parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='parse one file after the other and build the editions one '
+             'after the other (unless --jobs is set), each in a fresh '
+             'process')
+    parser.add_argument(
+        '--no-parse-cache',
+        action='store_true',
+        help='always parse all files, even if their parsed results are '
+             'cached (in tmp/parse_cache)')
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=None,
+        metavar='MiB',
+        help='maximum size of the parse cache, least recently used '
+             'results are removed (default: {})'.format(
+                 ParseCache.MAX_SIZE // 1024 // 1024))
+    parser.add_argument(
+        '--check-references',
+        action='store_true',
+        help='also check that all referenced IDs exist')
+    parser.add_argument(
+        '--sqlite',
+        action='store_true',
+        help='also write a sqlite database per edition '
+             '(data/<edition>/grundschutz.sqlite)')
+    parser.add_argument(
+        '--formats',
+        type=parse_formats,
+        default=['json'],
+        help='comma separated list of output formats of the json files '
+             '({}, default: json), like "json,ndjson.gz"'.format(
+                 ', '.join(JSON_FORMATS)))
+    parser.add_argument(
+        '--report',
+        help='write time, CPU time, peak memory and number of items '
+             'per stage and edition into this json file')
+    parser.add_argument(
+        '--profile',
+        metavar='DIR',
+        help='write a cProfile dump per edition (<edition>.prof) into '
+             'this directory')
+    parser.add_argument(
+        '--watch',
+        type=float,
+        metavar='SECONDS',
+        help='keep running: build all editions, then check the sources '
+             'every SECONDS (conditional requests) and rebuild only the '
+             'changed editions')
+    parser.add_argument(
+        '--mirror',
+        metavar='URL',
+        help='download from this base URL instead of {} (local mirror or '
+             'test server)'.format(BSI.BSI_DOMAIN))
+    args = parser.parse_args()
+    options = {'check_refs': args.check_references,
+               'sqlite': args.sqlite,
+               'workers': args.workers,
+               'serial': args.serial,
+               'backend': args.backend,
+               'low_memory': args.low_memory,
+               'parse_cache': not args.no_parse_cache,
+               'cache_size': (args.cache_size * 1024 * 1024
+                              if args.cache_size is not None else None),
+               'profile_dir': args.profile,
+               'mirror': args.mirror,
+               'formats': args.formats}
+
+    if args.watch is not None:
+        watch(args.editions, args.watch, args.jobs, args.low_memory, options)
+        return
+
+    report, errors = build_all(args.editions, args.jobs, args.low_memory,
+                               options)
+
+    for year, stats in report.items():
+        if year not in errors:
+            print('Edition {}: {:.1f} s, peak memory {:.0f} MiB'.format(
+                year, stats['wall_time'],
+                stats['peak_rss'] / 1024 / 1024))
+
+    if args.report:
+        save_json_dict(args.report, {str(x): report[x] for x in report})
+
+    # report all failed editions at once
+    for year, error in errors.items():
+        print('Edition {} failed:\n{}'.format(year, error), file=sys.stderr)
+    if len(errors) > 0:
+        sys.exit('{} of {} editions failed: {}'.format(
+            len(errors), len(args.editions),
+            ', '.join(str(x) for x in errors)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# export already converted editions (data/<edition>/*.json)
+# into a single sqlite database
+import argparse
+import os
+
+from lib.common import DATA_DIR, get_converted_editions, load_edition
+from lib.export import create_sqlite
+
+
+def main() -> None:
+    editions = get_converted_editions()
+    parser = argparse.ArgumentParser(
+        description='Export converted editions into a sqlite database')
+    parser.add_argument(
+        'database',
+        help='path of the sqlite database (will be replaced)')
+    parser.add_argument(
+        '--editions',
+        type=lambda x: [y.strip() for y in x.split(',')],
+        default=editions,
+        help='comma separated list of editions (default: all, {})'.format(
+            ','.join(editions)))
+    args = parser.parse_args()
+
+    for edition in args.editions:
+        if edition not in editions:
+            parser.error('unknown edition: {}'.format(edition))
+
+    create_sqlite(args.database,
+                  {x: load_edition(os.path.join(DATA_DIR, x))
+                   for x in args.editions})
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,101 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import glob
 import os
 import subprocess
-from typing import Optional
-import zipfile
-
-import pandas
+from typing import Callable, Iterator, Optional, TYPE_CHECKING
 
+from .cache import ParseCache
 from .common import (
-    clean_gap, download_binary, get_dataframe_from_csv, get_html_from_file
+    clean_gap, ExcelWorkbook, extract_zip, get_file_hash,
+    get_html_from_file, get_outline_and_value_from_xml, get_xpath,
+    iter_csv_rows, load_json_dict, save_json_dict
 )
+from .stats import Stats
+
+if TYPE_CHECKING:
+    from .download import Downloader
+
+# version of the parsers, increase it whenever the parsing changes
+# (part of the parse cache key, so old results are not used anymore)
+PARSER_VERSION = 1
+
+# xpath expressions (compiled once, see get_xpath)
+XPATH_LINKS = '//a'
+# responsible person of a Baustein,
+# yes we need the NBSP character here
+XPATH_ROLLE = (
+    '//p[starts-with(text(), '
+    '"Grundsätzlich zuständig")]/text()')
+XPATH_ROLLE_NEXT = (
+    '//p[starts-with(text(), '
+    '"Grundsätzlich zuständig")]'
+    '/following::p/text()')
+
+# key of the responsible person of a Baustein (with NBSP)
+ROLLE_KEY = 'Grundsätzlich zuständig'
+
+# options for tool "pdftohtml" per conversion backend
+PDFTOHTML_OPTIONS = {
+    # outline (s.html) and content (-html.html)
+    'html': [
+        # single document
+        '-s',
+        # ingore images
+        '-i',
+    ],
+    # outline and positioned text in a single file (.xml)
+    'xml': [
+        '-xml',
+        # ingore images
+        '-i',
+    ],
+}
+
+
+# a Baustein with its Anforderungen (number -> (name, label)),
+# with slots to keep the records of a whole edition small
+class Baustein(object):
+    __slots__ = ('category', 'number', 'name', 'label', 'rolle',
+                 'anforderungen')
+
+    def __init__(self,
+                 category: str,
+                 number: str,
+                 name: str,
+                 label: str,
+                 rolle: Optional[str],
+                 anforderungen: dict) -> None:
+        self.category = category
+        self.number = number
+        self.name = name
+        self.label = label
+        self.rolle = rolle
+        self.anforderungen = anforderungen
+
+    def to_dict(self) -> dict:
+        return {'name': self.name,
+                'label': self.label,
+                'rolle': self.rolle,
+                'anforderungen': {
+                    number: {'name': name, 'label': label}
+                    for number, (name, label) in self.anforderungen.items()}}
 
 
 class BSIFactory(object):
+    # all available editions
+    VERSIONS = [2020, 2021, 2022, 2023]
+
     @staticmethod
-    def get_bsi_version(year):
+    def get_bsi_version(year, **kwargs):
         if year == 2020:
-            return BSI2020()
+            return BSI2020(**kwargs)
         if year == 2021:
-            return BSI()
+            return BSI(**kwargs)
         if year == 2022:
-            return BSI2022()
+            return BSI2022(**kwargs)
         if year == 2023:
-            return BSI2023()
+            return BSI2023(**kwargs)
 
 
 class BSI(object):
@@ -60,15 +134,28 @@ class BSI(object):
     # excel sheet name template
     EXCEL_SHEET_NAME = 'KRT_{}.xlsx'
 
-    def __init__(self, tmpdir: Optional[str] = None) -> None:
+    def __init__(self,
+                 tmpdir: Optional[str] = None,
+                 workers: Optional[int] = None,
+                 serial: bool = False,
+                 backend: str = 'html',
+                 low_memory: bool = False,
+                 parse_cache: bool = True,
+                 cache_size: Optional[int] = None,
+                 mirror: Optional[str] = None) -> None:
+        if backend not in PDFTOHTML_OPTIONS:
+            raise ValueError('Unknown conversion backend: {}'.format(backend))
+
         # all Bausteinkategorien
         self.bausteinkategorien = {}
         # all Gefaehrdungen
         self.gefaehrdungen = {}
         # all Bausteine including their Anforderungen
         self.baustein = {}
-        # KRT (list of dataframes)
+        # KRT (excel workbook)
         self.krt = None
+        # KRT as dict: Anforderung -> {Gefährdung: Schutzziele}
+        self.krt_index = None
 
         # tmp dir for downloads and conversions
         self.tmpdir = tmpdir
@@ -97,48 +184,242 @@ class BSI(object):
         os.makedirs(self.baustein_dir_extract, exist_ok=True)
         # folder of bausteine
         self.baustein_dir = self.baustein_dir_extract
-
-    def _download(self) -> None:
-        if not os.path.exists(self.overview_html):
-            download_binary(self.OVERVIEW_URL, self.overview_html)
+        # number of parallel workers (defaults to the number of CPUs)
+        self.workers = workers or os.cpu_count() or 1
+        # parse html files in this process only (for debugging)
+        self.serial = serial
+        # output format of "pdftohtml" (html or xml)
+        self.backend = backend
+        # parse one file after the other and keep as little as possible
+        self.low_memory = low_memory
+        # manifest of already extracted PDFs (from the ZIP file)
+        self.extract_cache = os.path.join(self.tmpdir, 'extract_cache.json')
+        # manifest of already converted PDFs
+        self.conversion_cache = os.path.join(
+            self.tmpdir, 'conversion_cache.json')
+        # version of tool "pdftohtml" (part of the conversion cache key)
+        self._pdftohtml_version = None
+        # parsed results (shared by all editions next to their tmp dirs)
+        self.parse_cache = None
+        if parse_cache:
+            self.parse_cache = ParseCache(
+                os.path.join(os.path.dirname(self.tmpdir), 'parse_cache'),
+                cache_size)
+        # shared session for all downloads (created on first use)
+        self._downloader = None
+        # base URL used instead of BSI_DOMAIN (local mirror or test server)
+        self.mirror = mirror.rstrip('/') if mirror else None
+        # time and resources per stage
+        self.stats = Stats()
+
+    @property
+    def downloader(self) -> 'Downloader':
+        if self._downloader is None:
+            # requests is only imported if something is downloaded
+            from .download import Downloader
+
+            self._downloader = Downloader()
+
+        return self._downloader
+
+    # (url, destination) of all files to download besides the overview
+    def _get_downloads(self) -> list:
+        downloads = []
         if self.KOMPENDIUM_URL:
-            if not os.path.exists(self.kompendium_zip):
-                download_binary(self.KOMPENDIUM_URL, self.kompendium_zip)
-        if not os.path.exists(self.gefaerdungen_pdf):
-            download_binary(self.GEFAEHRDUNGEN_URL, self.gefaerdungen_pdf)
-        if self.krt_xlsx and not os.path.exists(self.krt_xlsx):
-            download_binary(self.KRT_URL, self.krt_xlsx)
-        if self.krt_csv and not os.path.exists(self.krt_csv):
-            download_binary(self.KRT_URL, self.krt_csv)
+            downloads.append((self.KOMPENDIUM_URL, self.kompendium_zip))
+        downloads.append((self.GEFAEHRDUNGEN_URL, self.gefaerdungen_pdf))
+        if self.krt_xlsx:
+            downloads.append((self.KRT_URL, self.krt_xlsx))
+        if self.krt_csv:
+            downloads.append((self.KRT_URL, self.krt_csv))
+
+        return downloads
+
+    def _get_url(self, url: str) -> str:
+        if self.mirror and url.startswith(self.BSI_DOMAIN):
+            return self.mirror + url[len(self.BSI_DOMAIN):]
+
+        return url
+
+    # download missing files (or all changed files, if check is set)
+    # and return the paths of the (re)written files
+    def _download(self, check: bool = False) -> list:
+        from .download import DownloadError
+
+        changed = []
+        with self.stats.stage('download') as stage:
+            # overview first, it is needed to find further downloads
+            if self.downloader.download(self._get_url(self.OVERVIEW_URL),
+                                        self.overview_html,
+                                        check):
+                changed.append(self.overview_html)
+            try:
+                changed += self.downloader.download_all(
+                    [(self._get_url(url), dest)
+                     for url, dest in self._get_downloads()],
+                    check)
+            except DownloadError as e:
+                # report the overview as well, if it was written
+                e.changed = changed + e.changed
+                raise
+            stage['items'] = len(changed)
+
+        return changed
 
     def _prepare(self) -> None:
         # unzip
         if os.path.exists(self.kompendium_zip):
-            with zipfile.ZipFile(self.kompendium_zip, 'r') as zf:
-                zf.extractall(self.baustein_dir_extract)
+            with self.stats.stage('unzip') as stage:
+                # only write new or changed PDFs (keeps mtimes of the others)
+                stage['items'] = len(extract_zip(self.kompendium_zip,
+                                                 self.baustein_dir_extract,
+                                                 self.extract_cache))
 
         # convert pdf to html with tool "pdf2html"
         pdfs = glob.glob(os.path.join(self.baustein_dir, '*.pdf'))
         pdfs.append(self.gefaerdungen_pdf)
+
+        # skip PDFs which were already converted (same content, same tool)
+        cache = load_json_dict(self.conversion_cache)
+        keys = {}
+        todo = []
         for pdf in pdfs:
-            # delete old html files from earlier runs
-            htmls = glob.glob(
+            entry = cache.get(os.path.relpath(pdf, self.tmpdir))
+            keys[pdf] = self._get_conversion_key(pdf, entry)
+            if (entry is None or entry['key'] != keys[pdf] or
+                    not self._conversion_outputs_valid(entry['outputs'])):
+                todo.append(pdf)
+
+        # delete old html (or xml) files from earlier runs
+        # (before converting, so no running conversion gets disturbed)
+        for pdf in todo:
+            outputs = glob.glob(
                 os.path.join(os.path.dirname(pdf),
-                             '{}*.html'.format(os.path.splitext(pdf)[0])))
-            for item in htmls:
+                             '{}*.{}'.format(os.path.splitext(pdf)[0],
+                                             self.backend)))
+            for item in outputs:
                 os.remove(item)
 
-            command = [
-                'pdftohtml',
-                # single document
-                '-s',
-                # ingore images
-                '-i',
-                pdf
-            ]
+        with self.stats.stage('pdftohtml') as stage:
+            failed = self._convert_pdfs(todo)
+            stage['items'] = len(todo)
+
+        # remember successful conversions, even if some others failed
+        failed_pdfs = [x[0] for x in failed]
+        for pdf in todo:
+            relpath = os.path.relpath(pdf, self.tmpdir)
+            if pdf in failed_pdfs:
+                cache.pop(relpath, None)
+                continue
+            cache[relpath] = self._get_conversion_entry(pdf, keys[pdf])
+        save_json_dict(self.conversion_cache, cache)
+
+        if len(failed) > 0:
+            raise RuntimeError(
+                'pdftohtml failed for {} of {} PDFs:\n{}'.format(
+                    len(failed), len(todo), '\n'.join(
+                        '  {} (exit code {}): {}'.format(*x)
+                        for x in failed)))
 
-            p = subprocess.Popen(command)
-            p.wait()
+    @staticmethod
+    def _get_pdftohtml_version() -> str:
+        try:
+            p = subprocess.run(['pdftohtml', '-v'],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+        except OSError:
+            return ''
+
+        # first line looks like "pdftohtml version 22.02.0"
+        output = p.stdout.decode('utf-8', 'replace').strip()
+
+        return output.splitlines()[0] if output else ''
+
+    def _get_conversion_key(self, pdf: str, entry: Optional[dict]) -> str:
+        if self._pdftohtml_version is None:
+            self._pdftohtml_version = self._get_pdftohtml_version()
+
+        # PDF not touched since the last conversion, no need to hash it
+        stat = os.stat(pdf)
+        if (entry is not None and
+                entry.get('pdf') == [stat.st_size, stat.st_mtime_ns]):
+            file_hash = entry['key'].split('|')[0]
+        else:
+            file_hash = get_file_hash(pdf)
+
+        return '{}|{}|{}'.format(file_hash,
+                                 self._pdftohtml_version,
+                                 ' '.join(PDFTOHTML_OPTIONS[self.backend]))
+
+    @staticmethod
+    def _get_conversion_outputs_paths(pdf: str, backend: str) -> list:
+        file_prefix = os.path.splitext(pdf)[0]
+
+        if backend == 'xml':
+            return ['{}.xml'.format(file_prefix)]
+
+        return ['{}s.html'.format(file_prefix),
+                '{}-html.html'.format(file_prefix)]
+
+    def _get_conversion_outputs(self, pdf: str) -> dict:
+        outputs = {}
+        for path in self._get_conversion_outputs_paths(pdf, self.backend):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                outputs[os.path.relpath(path, self.tmpdir)] = [
+                    stat.st_size, stat.st_mtime_ns]
+
+        return outputs
+
+    # conversion cache entry of an (already converted) PDF
+    def _get_conversion_entry(self, pdf: str, key: str) -> dict:
+        stat = os.stat(pdf)
+
+        return {'key': key,
+                'pdf': [stat.st_size, stat.st_mtime_ns],
+                'outputs': self._get_conversion_outputs(pdf)}
+
+    def _conversion_outputs_valid(self, outputs: dict) -> bool:
+        if len(outputs) == 0:
+            return False
+
+        for relpath, (size, mtime_ns) in outputs.items():
+            path = os.path.join(self.tmpdir, relpath)
+            if not os.path.exists(path):
+                return False
+            stat = os.stat(path)
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                return False
+
+        return True
+
+    def _convert_pdf(self, pdf: str) -> tuple:
+        command = ['pdftohtml'] + PDFTOHTML_OPTIONS[self.backend] + [pdf]
+
+        try:
+            p = subprocess.run(command,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+        except OSError as e:
+            return pdf, None, str(e)
+
+        return pdf, p.returncode, p.stderr.decode('utf-8', 'replace').strip()
+
+    # convert PDFs in parallel and return the failed ones
+    def _convert_pdfs(self, pdfs: list) -> list:
+        failed = []
+        if len(pdfs) == 0:
+            return failed
+
+        print('Converting {} PDFs with {} workers'.format(
+            len(pdfs), self.workers))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for pdf, returncode, error in executor.map(self._convert_pdf,
+                                                       pdfs):
+                if returncode != 0:
+                    failed.append((pdf, returncode, error))
+
+        return failed
 
     def setup(self) -> None:
         # download Kompendium files
@@ -146,20 +427,49 @@ class BSI(object):
         # ... extract and convert to html
         self._prepare()
 
-        # init KRT with pandas (via openpyxl)
-        self.krt = pandas.read_excel(self.krt_xlsx,
-                                     engine='openpyxl',
-                                     # set to None to get all sheets as list
-                                     sheet_name=None,
-                                     dtype=str,
-                                     # skip NaN values
-                                     na_values=[],
-                                     keep_default_na=False)
+        # init KRT (read-only, sheets are only loaded if needed)
+        self.krt = ExcelWorkbook(self.krt_xlsx)
+        # index of all Gefährdungen (with Schutzziele) per Anforderung,
+        # every sheet is streamed once
+        with self.stats.stage('krt') as stage:
+            self.krt_index = self._cached('krt',
+                                          [self.krt_xlsx],
+                                          self._get_krt_index)
+            stage['items'] = len(self.krt_index)
+        self.krt.close()
+
+    # parse cache key of a result, based on the content of all input files
+    def _get_cache_key(self, kind: str, inputs: list) -> str:
+        return ParseCache.get_key(
+            PARSER_VERSION, self.VERSION, self.backend, kind,
+            [[os.path.relpath(x, self.tmpdir),
+              get_file_hash(x) if os.path.exists(x) else None]
+             for x in inputs])
+
+    # parsed result from the parse cache (parsed and remembered if missing)
+    def _cached(self, kind: str, inputs: list, parse: Callable):
+        if self.parse_cache is None:
+            return parse()
+
+        key = self._get_cache_key(kind, inputs)
+        value = self.parse_cache.get(key)
+        if value is None:
+            value = parse()
+            self.parse_cache.set(key, value)
+
+        return value
 
     def get_bausteinkategorien(self) -> dict:
-        if len(self.bausteinkategorien) > 0:
-            return self.bausteinkategorien
+        if len(self.bausteinkategorien) == 0:
+            self.bausteinkategorien = self._cached(
+                'bausteinkategorien',
+                [self.overview_html],
+                self._parse_bausteinkategorien)
 
+        return self.bausteinkategorien
+
+    def _parse_bausteinkategorien(self) -> dict:
+        bausteinkategorien = {}
         # parse Bausteinkategorien
         # get html
         html = get_html_from_file(self.overview_html)
@@ -176,165 +486,317 @@ class BSI(object):
             kat_name = kat_title_list[0]
             kat_label = kat_title_list[1]
 
-            self.bausteinkategorien[
-                clean_gap(kat_name)] = clean_gap(kat_label)
+            bausteinkategorien[clean_gap(kat_name)] = clean_gap(kat_label)
 
-        return self.bausteinkategorien
+        return bausteinkategorien
 
     def get_gefaehrdungen(self) -> dict:
-        if len(self.gefaehrdungen) > 0:
-            return self.gefaehrdungen
+        if len(self.gefaehrdungen) == 0:
+            self.gefaehrdungen = self._cached(
+                'gefaehrdungen',
+                self._get_conversion_outputs_paths(self.gefaerdungen_pdf,
+                                                   self.backend),
+                self._parse_gefaehrdungen)
 
+        return self.gefaehrdungen
+
+    def _parse_gefaehrdungen(self) -> dict:
+        gefaehrdungen = {}
         # parse Elementare_Gefaehrdungen toc
-        file_prefix = self.gefaerdungen_pdf.split('.pdf')[0]
-        # table of content
-        toc_path = '{}s.html'.format(file_prefix)
-        # get html
-        toc_html = get_html_from_file(toc_path)
+        with self.stats.stage('parse') as stage:
+            links, _ = self._read_toc(self.gefaerdungen_pdf, self.backend)
+            stage['items'] = 1
 
-        for gef_link in toc_html.xpath('//a'):
-            if gef_link.text_content().startswith('G 0'):
+        for gef_link in links:
+            if gef_link.startswith('G 0'):
                 # collect Gefaerdung attributes
-                gef_title = gef_link.text_content().strip()
+                gef_title = gef_link.strip()
                 gef_title_list = gef_title.split()
                 gef_name = ' '.join(gef_title_list[:2])
                 gef_number = gef_name.split('.')[1]
                 gef_label = ' '.join(gef_title_list[2:])
 
-                self.gefaehrdungen[gef_number] = {
+                gefaehrdungen[gef_number] = {
                     'name': clean_gap(gef_name),
                     'label': clean_gap(gef_label)
                 }
 
-        return self.gefaehrdungen
+        return gefaehrdungen
 
     def get_bausteine_with_anforderungen(self) -> dict:
         if len(self.baustein) > 0:
             return self.baustein
 
-        # loop through all Baustein PDFs
-        for path in glob.glob(os.path.join(self.baustein_dir, '*.pdf')):
-            file_prefix = os.path.splitext(path)[0]
-            # table of content
-            toc_path = '{}s.html'.format(file_prefix)
-            # content
-            content_path = '{}-html.html'.format(file_prefix)
-            # get html
-            toc_html = get_html_from_file(toc_path)
-            content_html = get_html_from_file(content_path)
-
-            for bau_link in toc_html.xpath('//a'):
-                if bau_link.text_content().startswith('IT-Grundschutz | '):
-                    # collect Baustein attributes
-                    bau_title = bau_link.text_content().split(
-                        'IT-Grundschutz | ')[1]
-                    bau_title_list = bau_title.split()
-                    bau_name = bau_title_list[0]
-                    bau_number = '.'.join(bau_name.split('.')[1:])
-                    bau_label = ' '.join(bau_title_list[1:])
-                    bau_cat = bau_name.split('.')[0]
-
-                    anforderungen = {}
-                    for anf_link in toc_html.xpath('//a'):
-                        if anf_link.text_content().startswith(bau_name):
-                            # collect Anforderung attributes
-                            anf_title_split = anf_link.text_content().split()
-                            anf_name = anf_title_split[0]
-                            # FIXME: typo in 2023
-                            if self.VERSION == '2023':
-                                if anf_name == 'OPS.2.3A22':
-                                    anf_name = 'OPS.2.3.A22'
-                            anf_number = anf_name.split(
-                                '{}.A'.format(bau_name))[1]
-                            anf_label = ' '.join(anf_title_split[1:])
-
-                            anforderungen[anf_number] = {
-                                'name': clean_gap(anf_name),
-                                'label': clean_gap(anf_label)}
-
-                            # fix label BSI2022
-                            if (self.VERSION == '2022' and
-                                    anf_name == 'INF.12.A16'):
-                                anforderungen[anf_number]['label'] = clean_gap(
-                                    anf_label).replace(' Haustechnik]',
-                                                       ' [Haustechnik]')
-
-                    # get responsible person
-                    # yes we need the NBSP character here
-                    rolle = content_html.xpath(
-                        '//p[starts-with(text(), '
-                        '"Grundsätzlich zuständig")]/text()')
-                    # if found
-                    if len(rolle) > 0:
-                        # sometimes the value for that key is in the same <p>
-                        # split key and value
-                        rolle = ' '.join(rolle[0].split(
-                            'Grundsätzlich zuständig')[1:]).strip()
-                        # if value not found, we need to get the next <p>
-                        if len(rolle) == 0:
-                            rolle = content_html.xpath(
-                                '//p[starts-with(text(), '
-                                '"Grundsätzlich zuständig")]'
-                                '/following::p/text()')[0].strip()
-
-                    # fix rolle BSI2022
-                    if self.VERSION in ['2022', '2023']:
-                        if rolle == 'OT-Betrieb':
-                            rolle = 'OT-Betrieb (Operational Technology, OT)'
-
-                    # fix rolle in BSI 2023
-                    if self.VERSION in ['2023']:
-                        if rolle == 'Informationssicherheitsbeauftragte':
-                            rolle = 'Informationssicherheitsbeauftragte (ISB)'
-
-                    if bau_cat not in self.baustein:
-                        self.baustein[bau_cat] = {}
-
-                    self.baustein[bau_cat][bau_number] = {
-                        'name': clean_gap(bau_name),
-                        'label': clean_gap(bau_label),
-                        'rolle': clean_gap(rolle),
-                        'anforderungen': anforderungen}
+        for baustein in self.iter_bausteine():
+            if baustein.category not in self.baustein:
+                self.baustein[baustein.category] = {}
+
+            self.baustein[baustein.category][
+                baustein.number] = baustein.to_dict()
 
         return self.baustein
 
-    def get_gefaehrdungen_by_anforderung(self, anf_name: str) -> dict:
-        bau_name = anf_name.split('.A')[0]
+    # parse all Baustein PDFs (sorted, to merge in a fixed order) and
+    # yield their Bausteine one by one (and remember them in the parse
+    # cache), in low memory mode one file after the other within this
+    # process and without the parse cache, so only the trees of a single
+    # file are in memory and no Bausteine are collected
+    def iter_bausteine(self) -> Iterator[Baustein]:
+        paths = sorted(glob.glob(os.path.join(self.baustein_dir, '*.pdf')))
+        if self.parse_cache is None or self.low_memory:
+            yield from self._parse_bausteine(paths)
+            return
+
+        # same as _cached, but streamed
+        inputs = [x for path in paths
+                  for x in self._get_conversion_outputs_paths(path,
+                                                              self.backend)]
+        key = self._get_cache_key('bausteine', inputs)
+        bausteine = self.parse_cache.get(key)
+        if bausteine is not None:
+            yield from bausteine
+            return
+
+        bausteine = []
+        for baustein in self._parse_bausteine(paths):
+            bausteine.append(baustein)
+            yield baustein
+        self.parse_cache.set(key, bausteine)
+
+    def _parse_bausteine(self, paths: list) -> Iterator[Baustein]:
+        parse = partial(self._parse_baustein_file, backend=self.backend)
+        with self.stats.stage('parse') as stage:
+            stage['items'] = len(paths)
+            if (self.low_memory or self.serial or self.workers == 1 or
+                    len(paths) < 2):
+                for bausteine in map(parse, paths):
+                    yield from bausteine
+            else:
+                # every file is independent, so parse them in separate
+                # processes (map keeps the order of the paths)
+                executor = ProcessPoolExecutor(
+                    max_workers=min(self.workers, len(paths)))
+                with executor:
+                    for bausteine in executor.map(parse, paths):
+                        yield from bausteine
+
+    # texts of all toc entries of a converted PDF, for xml also the
+    # responsible person of a Baustein (outline and text are in one file)
+    @staticmethod
+    def _read_toc(pdf: str, backend: str) -> tuple:
+        file_prefix = os.path.splitext(pdf)[0]
+
+        if backend == 'xml':
+            return get_outline_and_value_from_xml(
+                '{}.xml'.format(file_prefix), ROLLE_KEY)
+
+        # table of content
+        toc_html = get_html_from_file('{}s.html'.format(file_prefix))
+
+        links = get_xpath(XPATH_LINKS)(toc_html)
+
+        return [x.text_content() for x in links], None
+
+    # responsible person of a Baustein from the html content
+    @staticmethod
+    def _read_rolle_from_html(pdf: str) -> Optional[str]:
+        # content
+        content_html = get_html_from_file(
+            '{}-html.html'.format(os.path.splitext(pdf)[0]))
+        # get responsible person
+        rolle = get_xpath(XPATH_ROLLE)(content_html)
+        # if not found
+        if len(rolle) == 0:
+            return None
+
+        # sometimes the value for that key is in the same <p>
+        # split key and value
+        rolle = ' '.join(rolle[0].split(ROLLE_KEY)[1:]).strip()
+        # if value not found, we need to get the next <p>
+        if len(rolle) == 0:
+            rolle = get_xpath(XPATH_ROLLE_NEXT)(content_html)[0].strip()
+
+        return rolle
+
+    # parse Bausteine (with Anforderungen) of a single Baustein PDF,
+    # classmethod so it can be sent to a worker process without the instance
+    @classmethod
+    def _parse_baustein_file(cls, path: str, backend: str = 'html') -> list:
+        bausteine = []
+        links, rolle = cls._read_toc(path, backend)
+
+        # walk the toc once: collect Baustein titles and
+        # bucket all other links by the Baustein name they start with
+        bau_titles = []
+        other_links = []
+        for text in links:
+            if text.startswith('IT-Grundschutz | '):
+                bau_titles.append(text)
+            else:
+                other_links.append(text)
+        bau_links = {}
+        for bau_title in bau_titles:
+            bau_links[bau_title.split('IT-Grundschutz | ')[1].split()[0]] = []
+        for text in other_links:
+            for bau_name in bau_links:
+                if text.startswith(bau_name):
+                    bau_links[bau_name].append(text)
+
+        # responsible person is the same for all Bausteine in this file
+        # (html content is only read if the file contains a Baustein)
+        if len(bau_titles) > 0:
+            if backend == 'html':
+                rolle = cls._read_rolle_from_html(path)
+            rolle = cls._fix_baustein_rolle(rolle)
+
+        for bau_title in bau_titles:
+            # collect Baustein attributes
+            bau_title_list = bau_title.split('IT-Grundschutz | ')[1].split()
+            bau_name = bau_title_list[0]
+            bau_number = '.'.join(bau_name.split('.')[1:])
+            bau_label = ' '.join(bau_title_list[1:])
+            bau_cat = bau_name.split('.')[0]
+
+            anforderungen = {}
+            for anf_text in bau_links[bau_name]:
+                # collect Anforderung attributes
+                anf_title_split = anf_text.split()
+                anf_name = anf_title_split[0]
+                # FIXME: typo in 2023
+                if cls.VERSION == '2023':
+                    if anf_name == 'OPS.2.3A22':
+                        anf_name = 'OPS.2.3.A22'
+                anf_number = anf_name.split(
+                    '{}.A'.format(bau_name))[1]
+                anf_label = ' '.join(anf_title_split[1:])
+
+                anf_label = clean_gap(anf_label)
+                # fix label BSI2022
+                if (cls.VERSION == '2022' and
+                        anf_name == 'INF.12.A16'):
+                    anf_label = anf_label.replace(' Haustechnik]',
+                                                  ' [Haustechnik]')
+
+                anforderungen[anf_number] = (clean_gap(anf_name), anf_label)
+
+            bausteine.append(Baustein(bau_cat,
+                                      bau_number,
+                                      clean_gap(bau_name),
+                                      clean_gap(bau_label),
+                                      clean_gap(rolle),
+                                      anforderungen))
+
+        return bausteine
+
+    @classmethod
+    def _fix_baustein_rolle(cls, rolle: Optional[str]) -> Optional[str]:
+        # fix rolle BSI2022
+        if cls.VERSION in ['2022', '2023']:
+            if rolle == 'OT-Betrieb':
+                rolle = 'OT-Betrieb (Operational Technology, OT)'
+
+        # fix rolle in BSI 2023
+        if cls.VERSION in ['2023']:
+            if rolle == 'Informationssicherheitsbeauftragte':
+                rolle = 'Informationssicherheitsbeauftragte (ISB)'
+
+        return rolle
+
+    # name of the KRT sheet for a Baustein
+    def _get_krt_sheet_name(self, bau_name: str) -> str:
         sheet_name = bau_name
         # fix errors within KRT, overlooked by BSI (until 08.03.2022)
         if self.VERSION not in ['2022', '2023']:
             if bau_name == 'INF.2':
                 sheet_name = 'INF.2_'
-            if anf_name == 'ORP.1.A9':
-                anf_name = 'ORP.1.A09'
-            if anf_name == 'APP.4.4.A9':
-                anf_name = 'APP.4.4.A09'
-
-        sheet = self.krt[self.EXCEL_SHEET_NAME.format(sheet_name)]
-        all_gefaehrdungen = [x for x in sheet.columns[3:].values.tolist()
-                             if x.startswith('G')]
-
-        values = sheet[sheet[bau_name].apply(
-            lambda x: x.strip() == anf_name)].values.tolist()[0]
-        checked = values[3:]
-
-        gefaehrdungen_anf = {}
-        # fix errors within KRT, overlooked by BSI
-        for i, value in enumerate(all_gefaehrdungen):
-            newvalue = value
-            # FIXME: error in BSI 2023
-            if self.VERSION in ['2023']:
-                if value == 'G 0.0':
-                    newvalue = 'G 0.3'
-                if value == 'G.0.14':
-                    newvalue = 'G 0.14'
-            newvalue = newvalue.replace('G0', 'G 0')
-            newvalue = newvalue.replace('G.0', 'G 0.')
-            newvalue = newvalue.replace('G 0.0', 'G 0.')
-            if checked[i].lower().strip() == 'x':
-                gefaehrdungen_anf[newvalue] = values[2].upper().strip()
-
-        return gefaehrdungen_anf
+
+        return self.EXCEL_SHEET_NAME.format(sheet_name)
+
+    # Anforderungen with a different name within KRT (Kompendium -> KRT)
+    def _get_krt_anforderung_fixes(self) -> dict:
+        # fix errors within KRT, overlooked by BSI (until 08.03.2022)
+        if self.VERSION not in ['2022', '2023']:
+            return {'ORP.1.A9': 'ORP.1.A09',
+                    'APP.4.4.A9': 'APP.4.4.A09'}
+
+        return {}
+
+    def _fix_gefaehrdung_name(self, value: str) -> str:
+        newvalue = value
+        # FIXME: error in BSI 2023
+        if self.VERSION in ['2023']:
+            if value == 'G 0.0':
+                newvalue = 'G 0.3'
+            if value == 'G.0.14':
+                newvalue = 'G 0.14'
+        newvalue = newvalue.replace('G0', 'G 0')
+        newvalue = newvalue.replace('G.0', 'G 0.')
+        newvalue = newvalue.replace('G 0.0', 'G 0.')
+
+        return newvalue
+
+    # walk all KRT sheets once and
+    # collect Gefährdungen (with Schutzziele) per Anforderung
+    def _get_krt_index(self) -> dict:
+        index = {}
+        sheet_prefix, sheet_suffix = self.EXCEL_SHEET_NAME.split('{}')
+        for sheet_name in self.krt.sheet_names:
+            if not (sheet_name.startswith(sheet_prefix) and
+                    sheet_name.endswith(sheet_suffix)):
+                continue
+            inner_name = sheet_name[len(sheet_prefix):][:-len(sheet_suffix)]
+            # only use the sheet which would be chosen for the Baustein
+            bau_name = None
+            for candidate in [inner_name.rstrip('_'), inner_name]:
+                if self._get_krt_sheet_name(candidate) == sheet_name:
+                    bau_name = candidate
+                    break
+            if bau_name is None:
+                continue
+            rows = self.krt.iter_rows(sheet_name)
+            columns = next(rows, [])
+            if bau_name not in columns:
+                continue
+            bau_column = columns.index(bau_name)
+
+            # fix errors within KRT, overlooked by BSI
+            all_gefaehrdungen = [self._fix_gefaehrdung_name(x)
+                                 for x in columns[3:] if x.startswith('G')]
+
+            for values in rows:
+                # fill up empty cells at the end
+                values = values + [''] * (len(columns) - len(values))
+                anf_name = values[bau_column].strip()
+                # first row of an Anforderung (within its own Baustein) wins
+                if (anf_name.split('.A')[0] != bau_name or
+                        anf_name in index):
+                    continue
+                checked = values[3:]
+
+                gefaehrdungen_anf = {}
+                for i, value in enumerate(all_gefaehrdungen):
+                    if checked[i].lower().strip() == 'x':
+                        gefaehrdungen_anf[value] = values[2].upper().strip()
+                index[anf_name] = gefaehrdungen_anf
+
+        # make Anforderungen available under their Kompendium name
+        for anf_name, krt_name in self._get_krt_anforderung_fixes().items():
+            if krt_name in index:
+                index[anf_name] = index[krt_name]
+            else:
+                index.pop(anf_name, None)
+
+        return index
+
+    def get_gefaehrdungen_by_anforderungen(self) -> dict:
+        return self.krt_index
+
+    def get_gefaehrdungen_by_anforderung(self, anf_name: str) -> dict:
+        try:
+            return self.krt_index[anf_name]
+        except KeyError:
+            raise ValueError('Anforderung "{}" not found inside KRT'
+                             .format(anf_name))
 
 
 class BSI2022(BSI):
@@ -365,8 +827,8 @@ class BSI2022(BSI):
         '?__blob=publicationFile&v=7'
     )
 
-    def __init__(self, tmpdir: Optional[str] = None) -> None:
-        super().__init__(tmpdir)
+    def __init__(self, tmpdir: Optional[str] = None, **kwargs) -> None:
+        super().__init__(tmpdir, **kwargs)
 
         # folder of bausteine
         self.baustein_dir = os.path.join(self.baustein_dir, 'Einzeln_PDF')
@@ -395,8 +857,8 @@ class BSI2020(BSI):
         '?__blob=publicationFile&v=3'
     )
 
-    def __init__(self, tmpdir: Optional[str] = None) -> None:
-        super().__init__(tmpdir)
+    def __init__(self, tmpdir: Optional[str] = None, **kwargs) -> None:
+        super().__init__(tmpdir, **kwargs)
 
         # kreuzreferenztabelle in excel format [broken, dont want to use]
         self.krt_xlsx = None
@@ -409,19 +871,18 @@ class BSI2020(BSI):
         # ... extract and convert to html
         self._prepare()
 
-        # init KRT
-        self.krt = get_dataframe_from_csv(
-            self.krt_csv,
-            # add all non defined colums
-            prepend_text=';;;;;;;;;;;;;;;;;;;;;;;;;;;;;\n',
-            # skip empty header line
-            skip_lines=1,
-            sep=';',
-        )
+        # init KRT (streamed from the csv, no dataframe needed)
+        # index of all Gefährdungen (with Schutzziele) per Anforderung
+        with self.stats.stage('krt') as stage:
+            self.krt_index = self._cached('krt',
+                                          [self.krt_csv],
+                                          self._get_krt_index)
+            stage['items'] = len(self.krt_index)
 
-    def _download(self) -> None:
-        super()._download()
+    def _get_downloads(self) -> list:
+        downloads = super()._get_downloads()
 
+        # single Baustein PDFs (no ZIP file in 2020)
         html = get_html_from_file(self.overview_html)
         for anf_link in html.xpath(
                 '//div[contains(@class, "l-content-wrapper")]//p/a'):
@@ -429,38 +890,54 @@ class BSI2020(BSI):
             url = self.BSI_DOMAIN + anf_link.get('href')
             label = anf_link.text_content().strip() + '.pdf'
             dest = os.path.join(self.baustein_dir_extract, label)
-            if not os.path.exists(dest):
-                download_binary(url, dest)
+            downloads.append((url, dest))
 
-    def get_gefaehrdungen_by_anforderung(self, anf_name: str) -> dict:
+        return downloads
+
+    def _get_krt_index(self) -> dict:
         # FIXME:
         #  unfortunately we need to rely on the CSV instead XLSX,
         #  because the xlsx is messed up a lot:
         #  - missing Anforderungen
         #  - missing Gefährdungen
         #  - duplicated data
-        splitted = anf_name.split('.A')
-        bau_name = splitted[0]
-        number = splitted[1]
-        if len(number) == 1:
-            splitted[1] = '0{}'.format(number)
-        fixed_anf_name = '.A'.join(splitted)
-
-        baustein_values = self.krt[
-            self.krt['Unnamed: 0'].apply(
-                lambda x: x == bau_name)].values.tolist()
-
-        anforderung_values = self.krt[
-            self.krt['Unnamed: 0'].apply(
-                lambda x: x == fixed_anf_name)].values.tolist()
-
-        gefaehrdungen_anf = {}
-        for i, value in enumerate(anforderung_values[0]):
-            if value.lower().strip() == 'x':
-                fixed_gef = baustein_values[0][i].replace('G 0.0', 'G 0.')
-                gefaehrdungen_anf[fixed_gef] = anforderung_values[0][1]
-
-        return gefaehrdungen_anf
+        # walk the csv once, remembering the header row of every Baustein
+        # (the first row per name wins, like for the Anforderungen)
+        bausteine = {}
+        index = {}
+        for values in iter_csv_rows(self.krt_csv,
+                                    # skip empty header line
+                                    skip_lines=1,
+                                    sep=';'):
+            name = values[0]
+            splitted = name.split('.A')
+            if len(splitted) < 2:
+                bausteine.setdefault(name, values)
+                continue
+            # only Anforderungen with (at least) two digits are used
+            if len(splitted[1]) == 1 or name in index:
+                continue
+            baustein_values = bausteine.get(splitted[0])
+            if baustein_values is None:
+                continue
+
+            gefaehrdungen_anf = {}
+            for i, value in enumerate(values):
+                if value.lower().strip() == 'x':
+                    gef = (baustein_values[i]
+                           if i < len(baustein_values) else '')
+                    fixed_gef = gef.replace('G 0.0', 'G 0.')
+                    gefaehrdungen_anf[fixed_gef] = values[1]
+            index[name] = gefaehrdungen_anf
+
+        # Anforderungen with one digit are named with two digits in KRT
+        for name in list(index):
+            splitted = name.split('.A')
+            if len(splitted[1]) == 2 and splitted[1].startswith('0'):
+                splitted[1] = splitted[1][1:]
+                index['.A'.join(splitted)] = index[name]
+
+        return index
 
 
 class BSI2023(BSI):
@@ -491,8 +968,8 @@ class BSI2023(BSI):
             '?__blob=publicationFile&v=8'
     )
 
-    def __init__(self, tmpdir: Optional[str] = None) -> None:
-        super().__init__(tmpdir)
+    def __init__(self, tmpdir: Optional[str] = None, **kwargs) -> None:
+        super().__init__(tmpdir, **kwargs)
 
         # folder of bausteine
         self.baustein_dir = os.path.join(self.baustein_dir, 'Einzeln_PDF')
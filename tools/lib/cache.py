@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Optional
+
+
+# on-disk cache of parsed results (one pickle file per entry), can be
+# shared by all editions, the least recently used entries are removed
+# as soon as the cache gets too big
+class ParseCache(object):
+    # default maximum size of all entries (in bytes)
+    MAX_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, directory: str, max_size: Optional[int] = None) -> None:
+        self.directory = directory
+        self.max_size = self.MAX_SIZE if max_size is None else max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    # key for all parts (must be json serializable)
+    @staticmethod
+    def get_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(
+            parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, '{}.pickle'.format(key))
+
+    def get(self, key: str, default=None):
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except (OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError, ValueError):
+            # broken or outdated entry
+            return default
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    def set(self, key: str, value) -> None:
+        path = self._get_path(key)
+        # unique temp file, several editions may write at the same time
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        self._evict()
+
+    # remove the least recently used entries until the cache fits
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pickle'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
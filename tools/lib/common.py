@@ -1,78 +1,448 @@
+from contextlib import contextmanager
+import csv
+from functools import lru_cache
+import gzip
+import hashlib
 from io import StringIO
 import json
-from typing import Optional
+import os
+import shutil
+from typing import (BinaryIO, Callable, Iterable, Iterator, Optional,
+                    TYPE_CHECKING)
+import zipfile
+import zlib
 
-from lxml import html
-from lxml.etree import ElementTree
-import pandas
-import requests
+# heavy dependencies (lxml, openpyxl) are imported on first use,
+# so commands which don't parse anything start fast
+if TYPE_CHECKING:
+    from lxml.etree import ElementTree
+    import openpyxl
 
+# converted editions (data/<edition>)
+DATA_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data'))
 
-def download_binary(url: str, dest: str) -> None:
-    print('Downloading: {}'.format(url))
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(dest, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+# json files of a converted edition (data/<edition>)
+EDITION_FILES = ['anforderung',
+                 'anforderung_gefaehrdung',
+                 'anforderungstyp',
+                 'baustein',
+                 'bausteinkategorie',
+                 'gefaehrdung',
+                 'rolle',
+                 'schutzziel']
+
+# output formats of the json files (extension -> newline delimited),
+# "json" is the pretty format (one element per line), "ndjson" has no
+# surrounding list, so it can be read element by element
+JSON_FORMATS = {'json': False,
+                'json.gz': False,
+                'ndjson': True,
+                'ndjson.gz': True}
+# buffer size for writing output files
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def get_file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def get_file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc
+
+
+# load a json object (dict) from a file, empty if missing or broken
+def load_json_dict(filename: str) -> dict:
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+# save a json object (dict) atomically via a temp file
+def save_json_dict(filename: str, data: dict) -> None:
+    tmp = '{}.tmp'.format(filename)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, filename)
+
+
+# extract only new or changed members of a zip file (by CRC and size),
+# what was extracted before is remembered in a manifest (with size and
+# mtime of the extracted file), so unchanged files are not even read
+def extract_zip(zip_path: str, dest: str, manifest_path: str) -> list:
+    manifest = load_json_dict(manifest_path)
+    dest = os.path.abspath(dest)
+    extracted = []
+
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for member in zf.infolist():
+            # never write outside of dest (like ZipFile.extractall)
+            path = os.path.normpath(os.path.join(
+                dest, member.filename.lstrip('/\\')))
+            if not path.startswith(dest + os.sep):
+                continue
+            if member.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+
+            if os.path.exists(path):
+                stat = os.stat(path)
+                known = manifest.get(member.filename)
+                if stat.st_size == member.file_size:
+                    if known == [member.CRC, stat.st_size, stat.st_mtime_ns]:
+                        continue
+                    # unknown file, compare its content
+                    if get_file_crc32(path) == member.CRC:
+                        manifest[member.filename] = [
+                            member.CRC, stat.st_size, stat.st_mtime_ns]
+                        continue
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = '{}.tmp'.format(path)
+            with zf.open(member) as source, open(tmp, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            os.replace(tmp, path)
+            stat = os.stat(path)
+            manifest[member.filename] = [
+                member.CRC, stat.st_size, stat.st_mtime_ns]
+            extracted.append(path)
+
+    save_json_dict(manifest_path, manifest)
+
+    return extracted
+
+
+# sort key for numbers like "1", "4.4" or "12.A3" (compares numerical
+# parts as numbers, so "2" < "10")
+def version_key(value: str) -> tuple:
+    return tuple((0, int(x), '') if x.isdigit() else (1, 0, x)
+                 for x in value.split('.'))
 
 
 def clean_gap(text: str) -> str:
     return text.replace(u'\xa0', ' ')
 
 
-def get_from_json(filename: str, attr: str, value: str) -> [int, ValueError]:
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+# list of json elements kept in memory, with a dict based lookup
+# on one attribute (IDs are the position inside the list)
+class JsonRegistry(object):
+    def __init__(self, filename: str, by: str = 'name') -> None:
+        self.filename = filename
+        self.by = by
+        self.elements = []
+        self._ids = {}
+
+    @classmethod
+    def from_json(cls, filename: str, by: str = 'name') -> 'JsonRegistry':
+        registry = cls(filename, by)
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            for elem in data:
+                registry.elements.append(elem)
+                if by in elem:
+                    registry._ids.setdefault(elem[by], elem['id'])
+
+        return registry
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def get(self, value: str) -> [int, ValueError]:
+        try:
+            return self._ids[value]
+        except KeyError:
+            raise ValueError('No item found with "{}"@"{}" inside {}'
+                             .format(value, self.by, self.filename))
+
+    # add element (without lookup) and return ID
+    def add(self, all_elems: dict) -> int:
+        thisid = len(self.elements)
+        obj = {'id': thisid}
+        obj.update(all_elems)
+        self.elements.append(obj)
+        if self.by in obj:
+            self._ids.setdefault(obj[self.by], thisid)
+
+        return thisid
+
+    # return ID if data (based on a key) is already known,
+    # if not, add it and return the new ID
+    def get_or_create(self, all_elems: dict) -> int:
+        try:
+            return self.get(all_elems[self.by])
+        except ValueError:
+            return self.add(all_elems)
+
+    def save(self, formats: Iterable[str] = ('json',)) -> None:
+        save_json(self.filename, self.elements, formats)
+
+
+# write a file via a temp file, which replaces the file only if
+# everything was written (gzip compressed if compress is set)
+@contextmanager
+def open_atomic(filename: str, compress: bool = False) -> Iterator[BinaryIO]:
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        with open(tmp, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            if compress:
+                # no timestamp, so unchanged data gives the same file
+                with gzip.GzipFile(os.path.basename(filename), 'wb',
+                                   fileobj=f, mtime=0) as gz:
+                    yield gz
+            else:
+                yield f
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# compact serializer for single elements (orjson if installed)
+@lru_cache(maxsize=None)
+def get_json_serializer() -> Callable[[object], bytes]:
+    try:
+        import orjson
+    except ImportError:
+        return lambda obj: json.dumps(
+            obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
 
-    if isinstance(data, list):
-        for elem in data:
-            if attr in elem and elem[attr] == value:
-                return elem['id']
+    return orjson.dumps
 
-    raise ValueError('No item found with "{}"@"{}" inside {}'
-                     .format(value, attr, filename))
 
+# path of a json file in another format (like "rolle.ndjson.gz")
+def get_json_path(filename: str, output_format: str) -> str:
+    base, ext = os.path.splitext(filename)
+    if ext != '.json':
+        base = filename
 
-def save_json(filename: str, elements: list) -> None:
-    with open(filename, 'w') as f:
-        f.write('[\n  %s\n]\n' % ',\n  '.join(
-            json.dumps(obj, ensure_ascii=False, separators=(', ', ': '))
-                for obj in elements))
+    return '{}.{}'.format(base, output_format)
 
 
-def get_html(text: str) -> ElementTree:
+# save a list of elements (streamed, atomically) in all given formats,
+# see JSON_FORMATS, "json" is written to filename itself, other formats
+# of earlier runs which are not given anymore are removed
+def save_json(filename: str,
+              elements: list,
+              formats: Iterable[str] = ('json',)) -> None:
+    formats = list(formats)
+    for output_format in formats:
+        if output_format not in JSON_FORMATS:
+            raise ValueError('Unknown json format: {}'.format(output_format))
+        path = filename
+        if output_format != 'json':
+            path = get_json_path(filename, output_format)
+
+        with open_atomic(path, output_format.endswith('.gz')) as f:
+            if JSON_FORMATS[output_format]:
+                dumps = get_json_serializer()
+                for obj in elements:
+                    f.write(dumps(obj))
+                    f.write(b'\n')
+                continue
+
+            f.write(b'[\n  ')
+            for i, obj in enumerate(elements):
+                if i > 0:
+                    f.write(b',\n  ')
+                f.write(json.dumps(obj,
+                                   ensure_ascii=False,
+                                   separators=(', ', ': ')).encode('utf-8'))
+            f.write(b'\n]\n')
+
+    for output_format in JSON_FORMATS:
+        if output_format == 'json' or output_format in formats:
+            continue
+        path = get_json_path(filename, output_format)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# load all json files of a converted edition, returns a dict of
+# name (like "anforderung") -> list of elements
+def load_edition(path: str) -> dict:
+    data = {}
+    for name in EDITION_FILES:
+        filename = os.path.join(path, '{}.json'.format(name))
+        with open(filename, 'r', encoding='utf-8') as f:
+            data[name] = json.load(f)
+
+    return data
+
+
+# names of all converted editions (sorted, like "2022", "2023"),
+# empty if nothing was converted yet (so --help still works)
+def get_converted_editions(data_dir: str = DATA_DIR) -> list:
+    if not os.path.isdir(data_dir):
+        return []
+
+    return sorted(x for x in os.listdir(data_dir)
+                  if os.path.isdir(os.path.join(data_dir, x)))
+
+
+def get_html(text: str) -> 'ElementTree':
+    from lxml import html
+
     # parse into xml tree
     tree = html.parse(StringIO(text))
 
     return tree
 
 
-def get_html_from_file(path: str) -> ElementTree:
+def get_html_from_file(path: str) -> 'ElementTree':
     with open(path, 'r', encoding='utf-8') as f:
         text = f.read()
 
     return get_html(text)
 
 
-def get_dataframe_from_csv(path: str,
-                           prepend_text: Optional[str] = '',
-                           skip_lines: Optional[int] = 0,
-                           sep: Optional[str] = ',') -> pandas.DataFrame:
-    with open(path, 'r', encoding='utf-8') as f:
-        text = f.read()
+# compiled xpath expression (once per process)
+@lru_cache(maxsize=None)
+def get_xpath(expr: str):
+    from lxml import etree
+
+    # plain strings as results, "smart" strings would keep the whole
+    # tree alive as long as a single result is used
+    return etree.XPath(expr, smart_strings=False)
+
+
+# stream a "pdftohtml -xml" file and return the texts of all outline
+# entries and the value of a key (within the same text element or the
+# next one), parsed elements are dropped to keep memory constant
+def get_outline_and_value_from_xml(path: str, key: str) -> tuple:
+    from lxml import etree
+
+    outline = []
+    value = None
+    # True if the key was found, but the value is within the next text
+    value_next = False
+
+    for _, elem in etree.iterparse(path,
+                                   events=('end',),
+                                   tag=('text', 'item'),
+                                   recover=True):
+        text = ''.join(elem.itertext())
+        if elem.tag == 'item':
+            outline.append(text)
+        elif value_next:
+            if len(text) > 0:
+                value = text.strip()
+                value_next = False
+        elif value is None and text.startswith(key):
+            # sometimes the value for that key is in the same element
+            value = ' '.join(text.split(key)[1:]).strip()
+            if len(value) == 0:
+                value = None
+                value_next = True
+
+        # drop parsed elements
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+    return outline, value
+
+
+# stream rows of a csv file (as lists of strings, without empty lines)
+def iter_csv_rows(path: str,
+                  skip_lines: Optional[int] = 0,
+                  sep: Optional[str] = ',') -> Iterator[list]:
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        # skip lines (headers)
+        for _ in range(skip_lines):
+            f.readline()
+
+        for row in csv.reader(f, delimiter=sep):
+            if len(row) > 0:
+                yield row
+
+
+# read-only access to the sheets of an excel file (via openpyxl),
+# rows are streamed
+class ExcelWorkbook(object):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._workbook = None
+
+    def _open(self) -> 'openpyxl.Workbook':
+        if self._workbook is None:
+            import openpyxl
+
+            self._workbook = openpyxl.load_workbook(self.path,
+                                                    read_only=True,
+                                                    data_only=True,
+                                                    keep_links=False)
+
+        return self._workbook
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+    @property
+    def sheet_names(self) -> list:
+        return self._open().sheetnames
+
+    @staticmethod
+    def _convert_cell(value) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+
+        return str(value)
 
-    # skip lines (headers)
-    text = '\n'.join(text.splitlines()[skip_lines:])
-    # add some other header before the lines
-    text = prepend_text + text
+    @staticmethod
+    def _get_columns(header: list) -> list:
+        columns = []
+        counts = {}
+        for i, value in enumerate(header):
+            name = value if value != '' else 'Unnamed: {}'.format(i)
+            # make duplicated names unique (like "G 0.1", "G 0.1.1")
+            if name in counts:
+                count = counts[name]
+                unique_name = '{}.{}'.format(name, count)
+                while unique_name in counts:
+                    count += 1
+                    unique_name = '{}.{}'.format(name, count)
+                counts[name] = count + 1
+                name = unique_name
+            counts[name] = 1
+            columns.append(name)
 
-    # read into a pandas dataframe
-    df = pandas.read_csv(StringIO(text),
-                         sep=sep,
-                         dtype=str,
-                         # skip NaN values
-                         na_values=[],
-                         keep_default_na=False)
+        return columns
 
-    return df
+    # stream rows of a sheet as lists of strings (empty cells as ''),
+    # empty rows are skipped, the first row is the header with
+    # unique names for all columns
+    def iter_rows(self, sheet_name: str) -> Iterator[list]:
+        header = True
+        worksheet = self._open()[sheet_name]
+        for row in worksheet.iter_rows(values_only=True):
+            values = [self._convert_cell(x) for x in row]
+            # skip empty cells at the end
+            while len(values) > 0 and values[-1] == '':
+                values.pop()
+            if len(values) == 0:
+                continue
+            if header:
+                values = self._get_columns(values)
+                header = False
+            yield values
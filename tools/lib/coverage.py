@@ -0,0 +1,134 @@
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .query import Edition
+
+
+# KRT of an edition as a matrix Anforderung x Gefährdung, every cell
+# is a bitmask of the affected Schutzziele (bit i = self.schutzziele[i]),
+# coverage queries are vectorized over all rows (and many targets)
+class CoverageMatrix(object):
+    def __init__(self, edition: Edition) -> None:
+        anforderungen = edition.get_all('anforderung')
+        gefaehrdungen = edition.get_all('gefaehrdung')
+        schutzziele = edition.get_all('schutzziel')
+        if len(schutzziele) > 8:
+            raise ValueError('Too many Schutzziele for a bitmask: {}'
+                             .format(len(schutzziele)))
+
+        self.anforderungen = [x.name for x in anforderungen]
+        self.gefaehrdungen = [x.name for x in gefaehrdungen]
+        self.schutzziele = [x.name for x in schutzziele]
+        rows = {x: i for i, x in enumerate(anforderungen)}
+        columns = {x: i for i, x in enumerate(gefaehrdungen)}
+        bits = {x: 1 << i for i, x in enumerate(schutzziele)}
+        self._rows = {x.name: i for x, i in rows.items()}
+
+        links = list(edition.anforderung_gefaehrdungen.values())
+        self.matrix = np.zeros((len(rows), len(columns)), dtype=np.uint8)
+        np.bitwise_or.at(
+            self.matrix,
+            (np.array([rows[x.anforderung] for x in links], dtype=np.intp),
+             np.array([columns[x.gefaehrdung] for x in links],
+                      dtype=np.intp)),
+            np.array([sum(bits[y] for y in x.schutzziele) for x in links],
+                     dtype=np.uint8))
+        # Anforderung x (Schutzziel, Gefährdung) as floats, so queries are
+        # a single matrix product
+        self._affected = np.stack(
+            [(self.matrix & (1 << i)) != 0
+             for i in range(len(self.schutzziele))],
+            axis=1).reshape(len(rows), -1).astype(np.float32)
+
+        # row masks per Baustein and Anforderungstyp
+        self._baustein_rows = {}
+        self._typ_rows = {}
+        for anf, i in rows.items():
+            self._baustein_rows.setdefault(anf.baustein.name, []).append(i)
+            self._typ_rows.setdefault(anf.anforderungstyp.name, []).append(i)
+
+    @classmethod
+    def from_directory(cls, path: str) -> 'CoverageMatrix':
+        return cls(Edition.from_directory(path))
+
+    def _get_row(self, name: str) -> int:
+        try:
+            return self._rows[name]
+        except KeyError:
+            raise ValueError('Anforderung "{}" not found'.format(name))
+
+    # boolean mask of rows: the given Anforderungen, or all Anforderungen
+    # of the given Bausteine, or all Anforderungen of the edition if
+    # neither is given (optionally only of some Anforderungstypen,
+    # like Basis and Standard)
+    def select(self,
+               anforderungen: Optional[Iterable[str]] = None,
+               bausteine: Optional[Iterable[str]] = None,
+               anforderungstypen: Optional[Iterable[str]] = None
+               ) -> np.ndarray:
+        if anforderungen is None and bausteine is None:
+            mask = np.ones(len(self.anforderungen), dtype=bool)
+        else:
+            mask = np.zeros(len(self.anforderungen), dtype=bool)
+        if anforderungen is not None:
+            mask[[self._get_row(x) for x in anforderungen]] = True
+        if bausteine is not None:
+            for name in bausteine:
+                if name not in self._baustein_rows:
+                    raise ValueError('Baustein "{}" not found'.format(name))
+                mask[self._baustein_rows[name]] = True
+        if anforderungstypen is not None:
+            types = np.zeros(len(self.anforderungen), dtype=bool)
+            for name in anforderungstypen:
+                types[self._typ_rows.get(name, [])] = True
+            mask &= types
+
+        return mask
+
+    # affected Gefährdungen per Schutzziel (Schutzziel x Gefährdung) for
+    # many row masks at once (targets x Anforderungen), as booleans of
+    # shape targets x Schutzziele x Gefährdungen
+    def affected(self, masks: np.ndarray) -> np.ndarray:
+        masks = np.atleast_2d(masks).astype(np.float32)
+        counts = masks @ self._affected
+
+        return (counts > 0).reshape(
+            len(masks), len(self.schutzziele), len(self.gefaehrdungen))
+
+    # covered and uncovered Gefährdungen per Schutzziel, for every target
+    # given by its implemented Anforderungen (row masks, see select) within
+    # a scope (row masks, default: whole edition)
+    def coverage_many(self,
+                      implemented: np.ndarray,
+                      scope: Optional[np.ndarray] = None) -> tuple:
+        implemented = np.atleast_2d(implemented)
+        if scope is None:
+            scope = np.ones_like(implemented)
+        relevant = self.affected(scope)
+        covered = self.affected(implemented) & relevant
+
+        return covered, relevant & ~covered
+
+    # same as coverage_many for a single target, as names per Schutzziel
+    def coverage(self,
+                 implemented: np.ndarray,
+                 scope: Optional[np.ndarray] = None) -> dict:
+        covered, uncovered = self.coverage_many(implemented, scope)
+        names = np.array(self.gefaehrdungen, dtype=object)
+
+        return {schutzziel: {'covered': names[covered[0, i]].tolist(),
+                             'uncovered': names[uncovered[0, i]].tolist()}
+                for i, schutzziel in enumerate(self.schutzziele)}
+
+    # coverage of implemented Anforderungen of some Bausteine (selected by
+    # Anforderungstyp), within all Gefährdungen of these Bausteine
+    def coverage_of_bausteine(self,
+                              bausteine: Iterable[str],
+                              anforderungstypen: Iterable[str]) -> dict:
+        bausteine = list(bausteine)
+
+        return self.coverage(
+            self.select(bausteine=bausteine,
+                        anforderungstypen=anforderungstypen),
+            self.select(bausteine=bausteine))
@@ -0,0 +1,86 @@
+import hashlib
+import json
+
+
+# hash of a normalized record (independent of the order of dict keys)
+def get_record_hash(record) -> str:
+    return hashlib.sha256(json.dumps(
+        record, ensure_ascii=False, sort_keys=True,
+        separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+# IDs -> names of one json file of an edition
+def _get_names(elements: list) -> dict:
+    return {x['id']: x['name'] for x in elements}
+
+
+# turn an edition (name -> list of elements, see load_edition) into
+# records keyed by name, with all IDs replaced by names, so records of
+# different editions can be compared
+def normalize_edition(data: dict) -> dict:
+    anforderungstypen = _get_names(data['anforderungstyp'])
+    bausteinkategorien = _get_names(data['bausteinkategorie'])
+    gefaehrdungen = _get_names(data['gefaehrdung'])
+    rollen = _get_names(data['rolle'])
+    schutzziele = _get_names(data['schutzziel'])
+    bausteine = _get_names(data['baustein'])
+    anforderungen = _get_names(data['anforderung'])
+
+    krt = {}
+    krt_by_anforderung = {}
+    for x in data['anforderung_gefaehrdung']:
+        anf = anforderungen[x['anforderung']]
+        gef = gefaehrdungen[x['gefaehrdung']]
+        value = sorted(schutzziele[y] for y in x['schutzziele'])
+        krt['{} {}'.format(anf, gef)] = {'anforderung': anf,
+                                         'gefaehrdung': gef,
+                                         'schutzziele': value}
+        krt_by_anforderung.setdefault(anf, {})[gef] = value
+
+    records = {'baustein': {}, 'anforderung': {}, 'krt': krt}
+    for x in data['baustein']:
+        records['baustein'][x['name']] = {
+            'label': x['label'],
+            'bausteinkategorie': bausteinkategorien[x['bausteinkategorie']],
+            'rolle': rollen[x['rolle']],
+        }
+    for x in data['anforderung']:
+        records['anforderung'][x['name']] = {
+            'label': x['label'],
+            'anforderungstyp': anforderungstypen[x['anforderungstyp']],
+            'baustein': bausteine[x['baustein']],
+            'rollen': sorted(rollen[y] for y in x['rollen']),
+            'gefaehrdungen': krt_by_anforderung.get(x['name'], {}),
+        }
+
+    return records
+
+
+# compare two dicts of name -> record, in linear time by comparing
+# the hashes of records with the same name
+def diff_records(old: dict, new: dict) -> dict:
+    old_hashes = {k: get_record_hash(v) for k, v in old.items()}
+    new_hashes = {k: get_record_hash(v) for k, v in new.items()}
+
+    changed = []
+    for name in sorted(old_hashes.keys() & new_hashes.keys()):
+        if old_hashes[name] != new_hashes[name]:
+            changed.append({'name': name,
+                            'old': old[name],
+                            'new': new[name]})
+
+    return {
+        'added': sorted(new_hashes.keys() - old_hashes.keys()),
+        'removed': sorted(old_hashes.keys() - new_hashes.keys()),
+        'changed': changed,
+    }
+
+
+# changes between two editions (see load_edition) for
+# Bausteine, Anforderungen and KRT links (Anforderung -> Gefährdung)
+def diff_editions(old: dict, new: dict) -> dict:
+    old = normalize_edition(old)
+    new = normalize_edition(new)
+
+    return {x: diff_records(old[x], new[x])
+            for x in ['baustein', 'anforderung', 'krt']}
@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .common import get_file_hash
+
+
+# some downloads failed, changed holds the destinations which were
+# (re)written anyway (they won't show up as changed again)
+class DownloadError(RuntimeError):
+    def __init__(self, message: str, changed: list) -> None:
+        super().__init__(message)
+        self.changed = changed
+
+
+# connection broke or timed out while streaming the body of a response
+class _StreamError(requests.exceptions.ChunkedEncodingError):
+    pass
+
+
+class Downloader(object):
+    # parallel downloads (be nice to the BSI servers)
+    WORKERS = 8
+    # retries per file (connection errors, 5xx, broken streams)
+    RETRIES = 3
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT = 60
+
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 retries: Optional[int] = None) -> None:
+        self.workers = workers or self.WORKERS
+        self.retries = self.RETRIES if retries is None else retries
+
+        # one session for all downloads, so connections get reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.workers,
+            pool_maxsize=self.workers,
+            max_retries=Retry(total=self.retries,
+                              backoff_factor=0.5,
+                              status_forcelist=[500, 502, 503, 504],
+                              allowed_methods=['GET', 'HEAD']))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def _get_meta_path(dest: str) -> str:
+        return '{}.download.json'.format(dest)
+
+    def _load_meta(self, dest: str) -> dict:
+        try:
+            with open(self._get_meta_path(dest), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        return meta if isinstance(meta, dict) else {}
+
+    def _save_meta(self, dest: str, meta: dict) -> None:
+        path = self._get_meta_path(dest)
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _get_validators(response: requests.Response) -> dict:
+        return {'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}
+
+    # download url to dest and return True if dest was (re)written with
+    # new content, existing files are kept unless check is set, then the
+    # server is asked (ETag / Last-Modified) whether the file changed
+    def download(self, url: str, dest: str, check: bool = False) -> bool:
+        if os.path.exists(dest) and not check:
+            return False
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self._download(url, dest)
+            except _StreamError:
+                # errors before the response are retried by the session
+                # itself, only a broken body is resumed here (the partial
+                # file is kept) with the next attempt
+                if attempt == self.retries:
+                    raise
+
+        return False
+
+    def _download(self, url: str, dest: str) -> bool:
+        part = '{}.part'.format(dest)
+        meta = self._load_meta(dest)
+        complete = meta.get('complete') or {}
+        partial = meta.get('partial') or {}
+
+        headers = {}
+        # conditional request for an existing file
+        if os.path.exists(dest) and complete.get('url') == url:
+            if complete.get('etag'):
+                headers['If-None-Match'] = complete['etag']
+            if complete.get('last_modified'):
+                headers['If-Modified-Since'] = complete['last_modified']
+
+        # resume a partial download, but only of the very same file
+        offset = 0
+        if os.path.exists(part):
+            validator = partial.get('etag') or partial.get('last_modified')
+            if partial.get('url') == url and validator:
+                offset = os.path.getsize(part)
+                headers['Range'] = 'bytes={}-'.format(offset)
+                headers['If-Range'] = validator
+            else:
+                os.remove(part)
+
+        with self.session.get(url,
+                              headers=headers,
+                              stream=True,
+                              timeout=self.TIMEOUT) as r:
+            # unchanged (conditional request)
+            if r.status_code == 304:
+                return False
+            # partial file is already complete (or broken), start again
+            if r.status_code == 416:
+                os.remove(part)
+                meta.pop('partial', None)
+                self._save_meta(dest, meta)
+                return self._download(url, dest)
+            r.raise_for_status()
+            print('Downloading: {}'.format(url))
+
+            validators = self._get_validators(r)
+            if r.status_code == 206:
+                # only append the very range asked for, anything else
+                # would corrupt the file, start again from scratch
+                if self._get_range_start(r) != offset:
+                    if offset == 0:
+                        raise requests.exceptions.HTTPError(
+                            'Unexpected range: {}'.format(
+                                r.headers.get('Content-Range')),
+                            response=r)
+                    r.close()
+                    os.remove(part)
+                    meta.pop('partial', None)
+                    self._save_meta(dest, meta)
+                    return self._download(url, dest)
+                mode = 'ab'
+            else:
+                # server sent the whole file (again)
+                mode = 'wb'
+                meta['partial'] = dict(validators, url=url)
+                self._save_meta(dest, meta)
+
+            with open(part, mode) as f:
+                try:
+                    for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
+                        f.write(chunk)
+                except (requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.ConnectionError) as e:
+                    raise _StreamError(e) from e
+
+        # same content again (server without ETag / Last-Modified or
+        # file from an earlier run without metadata), keep the old file
+        changed = not self._same_content(part, dest)
+        if changed:
+            # never leave a half written file at the destination
+            os.replace(part, dest)
+        else:
+            os.remove(part)
+        meta.pop('partial', None)
+        meta['complete'] = dict(validators, url=url)
+        self._save_meta(dest, meta)
+
+        return changed
+
+    # first byte of a partial response (Content-Range: bytes 100-199/200),
+    # None if missing or invalid
+    @staticmethod
+    def _get_range_start(response: requests.Response) -> Optional[int]:
+        match = re.match(r'bytes\s+(\d+)-\d+/(\d+|\*)$',
+                         response.headers.get('Content-Range', '').strip())
+        if match is None:
+            return None
+
+        return int(match.group(1))
+
+    @staticmethod
+    def _same_content(path: str, other: str) -> bool:
+        if not os.path.exists(other):
+            return False
+        if os.path.getsize(path) != os.path.getsize(other):
+            return False
+
+        return get_file_hash(path) == get_file_hash(other)
+
+    # download all (url, dest) pairs in parallel,
+    # return the destinations which were (re)written
+    # (raises DownloadError if any download failed)
+    def download_all(self, downloads: list, check: bool = False) -> list:
+        changed = []
+        failed = []
+
+        def worker(download: tuple) -> tuple:
+            url, dest = download
+            try:
+                return dest, self.download(url, dest, check), None
+            except (OSError, requests.exceptions.RequestException) as e:
+                return dest, False, '{}: {}'.format(url, e)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for dest, is_changed, error in executor.map(worker, downloads):
+                if error is not None:
+                    failed.append(error)
+                elif is_changed:
+                    changed.append(dest)
+
+        if len(failed) > 0:
+            raise DownloadError('{} of {} downloads failed:\n{}'.format(
+                len(failed), len(downloads),
+                '\n'.join('  {}'.format(x) for x in failed)), changed)
+
+        return changed
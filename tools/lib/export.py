@@ -0,0 +1,185 @@
+import os
+import sqlite3
+
+# tables mirror the json schemas, every table has the edition as part of
+# the primary key, so one database can hold several editions,
+# lists of IDs (like anforderung.rollen) get their own junction table
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS edition (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS anforderungstyp (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (edition, id)
+);
+CREATE TABLE IF NOT EXISTS schutzziel (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (edition, id)
+);
+CREATE TABLE IF NOT EXISTS rolle (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (edition, id)
+);
+CREATE TABLE IF NOT EXISTS bausteinkategorie (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (edition, id)
+);
+CREATE TABLE IF NOT EXISTS gefaehrdung (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (edition, id)
+);
+CREATE TABLE IF NOT EXISTS baustein (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    bausteinkategorie INTEGER NOT NULL,
+    rolle INTEGER NOT NULL,
+    PRIMARY KEY (edition, id),
+    FOREIGN KEY (edition, bausteinkategorie)
+        REFERENCES bausteinkategorie (edition, id),
+    FOREIGN KEY (edition, rolle) REFERENCES rolle (edition, id)
+);
+CREATE TABLE IF NOT EXISTS anforderung (
+    edition TEXT NOT NULL REFERENCES edition (name),
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    label TEXT NOT NULL,
+    anforderungstyp INTEGER NOT NULL,
+    baustein INTEGER NOT NULL,
+    PRIMARY KEY (edition, id),
+    FOREIGN KEY (edition, anforderungstyp)
+        REFERENCES anforderungstyp (edition, id),
+    FOREIGN KEY (edition, baustein) REFERENCES baustein (edition, id)
+);
+CREATE TABLE IF NOT EXISTS anforderung_rolle (
+    edition TEXT NOT NULL,
+    anforderung INTEGER NOT NULL,
+    rolle INTEGER NOT NULL,
+    PRIMARY KEY (edition, anforderung, rolle),
+    FOREIGN KEY (edition, anforderung) REFERENCES anforderung (edition, id),
+    FOREIGN KEY (edition, rolle) REFERENCES rolle (edition, id)
+);
+CREATE TABLE IF NOT EXISTS anforderung_gefaehrdung (
+    edition TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    anforderung INTEGER NOT NULL,
+    gefaehrdung INTEGER NOT NULL,
+    PRIMARY KEY (edition, id),
+    FOREIGN KEY (edition, anforderung) REFERENCES anforderung (edition, id),
+    FOREIGN KEY (edition, gefaehrdung) REFERENCES gefaehrdung (edition, id)
+);
+CREATE TABLE IF NOT EXISTS anforderung_gefaehrdung_schutzziel (
+    edition TEXT NOT NULL,
+    anforderung_gefaehrdung INTEGER NOT NULL,
+    schutzziel INTEGER NOT NULL,
+    PRIMARY KEY (edition, anforderung_gefaehrdung, schutzziel),
+    FOREIGN KEY (edition, anforderung_gefaehrdung)
+        REFERENCES anforderung_gefaehrdung (edition, id),
+    FOREIGN KEY (edition, schutzziel) REFERENCES schutzziel (edition, id)
+);
+CREATE INDEX IF NOT EXISTS anforderungstyp_name
+    ON anforderungstyp (edition, name);
+CREATE INDEX IF NOT EXISTS schutzziel_name ON schutzziel (edition, name);
+CREATE INDEX IF NOT EXISTS rolle_name ON rolle (edition, name);
+CREATE INDEX IF NOT EXISTS bausteinkategorie_name
+    ON bausteinkategorie (edition, name);
+CREATE INDEX IF NOT EXISTS gefaehrdung_name ON gefaehrdung (edition, name);
+CREATE INDEX IF NOT EXISTS baustein_name ON baustein (edition, name);
+CREATE INDEX IF NOT EXISTS baustein_bausteinkategorie
+    ON baustein (edition, bausteinkategorie);
+CREATE INDEX IF NOT EXISTS anforderung_name ON anforderung (edition, name);
+CREATE INDEX IF NOT EXISTS anforderung_baustein
+    ON anforderung (edition, baustein);
+CREATE INDEX IF NOT EXISTS anforderung_rolle_rolle
+    ON anforderung_rolle (edition, rolle);
+CREATE INDEX IF NOT EXISTS anforderung_gefaehrdung_anforderung
+    ON anforderung_gefaehrdung (edition, anforderung);
+CREATE INDEX IF NOT EXISTS anforderung_gefaehrdung_gefaehrdung
+    ON anforderung_gefaehrdung (edition, gefaehrdung);
+'''
+
+# columns per table (without edition), in the order referenced tables
+# have to be filled
+SQLITE_COLUMNS = [
+    ('anforderungstyp', ['id', 'name']),
+    ('schutzziel', ['id', 'name', 'label']),
+    ('rolle', ['id', 'name']),
+    ('bausteinkategorie', ['id', 'name', 'label']),
+    ('gefaehrdung', ['id', 'name', 'label']),
+    ('baustein', ['id', 'name', 'label', 'bausteinkategorie', 'rolle']),
+    ('anforderung', ['id', 'name', 'label', 'anforderungstyp', 'baustein']),
+    ('anforderung_gefaehrdung', ['id', 'anforderung', 'gefaehrdung']),
+]
+
+# lists of IDs -> junction table (table, attribute, junction table)
+SQLITE_JUNCTIONS = [
+    ('anforderung', 'rollen', 'anforderung_rolle'),
+    ('anforderung_gefaehrdung', 'schutzziele',
+     'anforderung_gefaehrdung_schutzziel'),
+]
+
+
+def _insert_edition(db: sqlite3.Connection,
+                    edition: str,
+                    data: dict) -> None:
+    # replace an existing edition
+    for table in ['anforderung_gefaehrdung_schutzziel', 'anforderung_rolle']:
+        db.execute('DELETE FROM {} WHERE edition = ?'.format(table),
+                   (edition,))
+    for table, _ in reversed(SQLITE_COLUMNS):
+        db.execute('DELETE FROM {} WHERE edition = ?'.format(table),
+                   (edition,))
+    db.execute('INSERT OR IGNORE INTO edition (name) VALUES (?)', (edition,))
+
+    for table, columns in SQLITE_COLUMNS:
+        db.executemany(
+            'INSERT INTO {} (edition, {}) VALUES (?, {})'.format(
+                table, ', '.join(columns), ', '.join('?' * len(columns))),
+            ([edition] + [x[c] for c in columns] for x in data[table]))
+
+    for table, attr, junction in SQLITE_JUNCTIONS:
+        db.executemany(
+            'INSERT INTO {} VALUES (?, ?, ?)'.format(junction),
+            ((edition, x['id'], y) for x in data[table] for y in x[attr]))
+
+
+# write editions into a sqlite database, data is a dict of
+# edition -> dict of name (like "anforderung") -> list of elements,
+# other editions already inside the database are kept
+def export_sqlite(db_path: str, data: dict) -> None:
+    db = sqlite3.connect(db_path)
+    try:
+        db.execute('PRAGMA foreign_keys = ON')
+        db.executescript(SQLITE_SCHEMA)
+        # one transaction for everything
+        with db:
+            for edition in sorted(data):
+                _insert_edition(db, edition, data[edition])
+        # statistics for the query planner
+        db.execute('ANALYZE')
+    finally:
+        db.close()
+
+
+# same as export_sqlite, but for a new database (written to a temporary
+# file first, so readers never see a half written database)
+def create_sqlite(db_path: str, data: dict) -> None:
+    tmp = '{}.tmp'.format(db_path)
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    export_sqlite(tmp, data)
+    os.replace(tmp, db_path)
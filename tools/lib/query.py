@@ -0,0 +1,239 @@
+from functools import lru_cache
+import os
+
+from .common import load_edition
+
+
+# records of a converted edition, IDs are resolved to the referenced
+# records, slots keep many records small
+class Record(object):
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id: int, name: str) -> None:
+        self.id = id
+        self.name = name
+
+    def __repr__(self) -> str:
+        return '<{} {}>'.format(type(self).__name__, self.name)
+
+    # json serializable dict, referenced records are given by name
+    def to_dict(self) -> dict:
+        data = {}
+        for cls in reversed(type(self).__mro__):
+            for attr in getattr(cls, '__slots__', ()):
+                value = getattr(self, attr)
+                if isinstance(value, Record):
+                    value = value.name
+                elif isinstance(value, tuple):
+                    value = [x.name for x in value]
+                data[attr] = value
+
+        return data
+
+
+class LabeledRecord(Record):
+    __slots__ = ('label',)
+
+    def __init__(self, id: int, name: str, label: str) -> None:
+        super().__init__(id, name)
+        self.label = label
+
+
+class Rolle(Record):
+    __slots__ = ()
+
+
+class Anforderungstyp(Record):
+    __slots__ = ()
+
+
+class Schutzziel(LabeledRecord):
+    __slots__ = ()
+
+
+class Bausteinkategorie(LabeledRecord):
+    __slots__ = ()
+
+
+class Gefaehrdung(LabeledRecord):
+    __slots__ = ()
+
+
+class Baustein(LabeledRecord):
+    __slots__ = ('bausteinkategorie', 'rolle')
+
+    def __init__(self,
+                 id: int,
+                 name: str,
+                 label: str,
+                 bausteinkategorie: Bausteinkategorie,
+                 rolle: Rolle) -> None:
+        super().__init__(id, name, label)
+        self.bausteinkategorie = bausteinkategorie
+        self.rolle = rolle
+
+
+class Anforderung(LabeledRecord):
+    __slots__ = ('anforderungstyp', 'baustein', 'rollen')
+
+    def __init__(self,
+                 id: int,
+                 name: str,
+                 label: str,
+                 anforderungstyp: Anforderungstyp,
+                 baustein: Baustein,
+                 rollen: tuple) -> None:
+        super().__init__(id, name, label)
+        self.anforderungstyp = anforderungstyp
+        self.baustein = baustein
+        self.rollen = rollen
+
+
+# Gefährdung of an Anforderung (a row of the KRT)
+class AnforderungGefaehrdung(object):
+    __slots__ = ('id', 'anforderung', 'gefaehrdung', 'schutzziele')
+
+    def __init__(self,
+                 id: int,
+                 anforderung: Anforderung,
+                 gefaehrdung: Gefaehrdung,
+                 schutzziele: tuple) -> None:
+        self.id = id
+        self.anforderung = anforderung
+        self.gefaehrdung = gefaehrdung
+        self.schutzziele = schutzziele
+
+
+# a converted edition (data/<edition>) with indexes by name and
+# from Bausteine, Rollen, Gefährdungen and Anforderungstypen to their
+# Anforderungen, all lookups are dict based
+class Edition(object):
+    def __init__(self, data: dict) -> None:
+        def by_id(cls, elements: list, *attrs) -> dict:
+            return {x['id']: cls(x['id'], x['name'], *[x[y] for y in attrs])
+                    for x in elements}
+
+        self.rollen = by_id(Rolle, data['rolle'])
+        self.anforderungstypen = by_id(Anforderungstyp,
+                                       data['anforderungstyp'])
+        self.schutzziele = by_id(Schutzziel, data['schutzziel'], 'label')
+        self.bausteinkategorien = by_id(Bausteinkategorie,
+                                        data['bausteinkategorie'], 'label')
+        self.gefaehrdungen = by_id(Gefaehrdung, data['gefaehrdung'],
+                                   'label')
+        self.bausteine = {x['id']: Baustein(
+            x['id'], x['name'], x['label'],
+            self.bausteinkategorien[x['bausteinkategorie']],
+            self.rollen[x['rolle']]) for x in data['baustein']}
+        self.anforderungen = {x['id']: Anforderung(
+            x['id'], x['name'], x['label'],
+            self.anforderungstypen[x['anforderungstyp']],
+            self.bausteine[x['baustein']],
+            tuple(self.rollen[y] for y in x['rollen']))
+            for x in data['anforderung']}
+        self.anforderung_gefaehrdungen = {x['id']: AnforderungGefaehrdung(
+            x['id'],
+            self.anforderungen[x['anforderung']],
+            self.gefaehrdungen[x['gefaehrdung']],
+            tuple(self.schutzziele[y] for y in x['schutzziele']))
+            for x in data['anforderung_gefaehrdung']}
+
+        # ID -> record and name -> record (per kind, like "baustein")
+        self._by_id = {'anforderung': self.anforderungen,
+                       'anforderungstyp': self.anforderungstypen,
+                       'baustein': self.bausteine,
+                       'bausteinkategorie': self.bausteinkategorien,
+                       'gefaehrdung': self.gefaehrdungen,
+                       'rolle': self.rollen,
+                       'schutzziel': self.schutzziele}
+        self._by_name = {}
+        for kind, records in self._by_id.items():
+            index = {}
+            for record in records.values():
+                index.setdefault(record.name, record)
+            self._by_name[kind] = index
+
+        # reverse indexes (record -> list of Anforderungen / KRT rows)
+        self._anforderungen_by_baustein = {}
+        self._anforderungen_by_rolle = {}
+        self._anforderungen_by_anforderungstyp = {}
+        for anf in self.anforderungen.values():
+            self._anforderungen_by_baustein.setdefault(
+                anf.baustein, []).append(anf)
+            self._anforderungen_by_anforderungstyp.setdefault(
+                anf.anforderungstyp, []).append(anf)
+            for rolle in anf.rollen:
+                self._anforderungen_by_rolle.setdefault(
+                    rolle, []).append(anf)
+        self._links_by_anforderung = {}
+        self._links_by_gefaehrdung = {}
+        for link in self.anforderung_gefaehrdungen.values():
+            self._links_by_anforderung.setdefault(
+                link.anforderung, []).append(link)
+            self._links_by_gefaehrdung.setdefault(
+                link.gefaehrdung, []).append(link)
+
+    @classmethod
+    def from_directory(cls, path: str) -> 'Edition':
+        return cls(load_edition(path))
+
+    # kinds of records (names of the json files, like "baustein")
+    @property
+    def kinds(self) -> list:
+        return sorted(self._by_id)
+
+    # all records of a kind (ordered by ID)
+    def get_all(self, kind: str) -> list:
+        try:
+            return list(self._by_id[kind].values())
+        except KeyError:
+            raise ValueError('Unknown kind: {}'.format(kind))
+
+    # record by name, kind is the name of the json file (like "baustein")
+    def get(self, kind: str, name: str):
+        try:
+            return self._by_name[kind][name]
+        except KeyError:
+            raise ValueError('No {} found with name "{}"'.format(kind, name))
+
+    def get_anforderungen_by_baustein(self, name: str) -> list:
+        return list(self._anforderungen_by_baustein.get(
+            self.get('baustein', name), []))
+
+    def get_anforderungen_by_rolle(self, name: str) -> list:
+        return list(self._anforderungen_by_rolle.get(
+            self.get('rolle', name), []))
+
+    def get_anforderungen_by_anforderungstyp(self, name: str) -> list:
+        return list(self._anforderungen_by_anforderungstyp.get(
+            self.get('anforderungstyp', name), []))
+
+    def get_anforderungen_by_gefaehrdung(self, name: str) -> list:
+        return [x.anforderung for x in self._links_by_gefaehrdung.get(
+            self.get('gefaehrdung', name), [])]
+
+    # Gefährdungen of an Anforderung, with the affected Schutzziele
+    def get_gefaehrdungen_by_anforderung(self, name: str) -> list:
+        return [(x.gefaehrdung, x.schutzziele)
+                for x in self._links_by_anforderung.get(
+                    self.get('anforderung', name), [])]
+
+    # all Gefährdungen of the Anforderungen of a Baustein
+    # (in the order they are referenced first)
+    def get_gefaehrdungen_by_baustein(self, name: str) -> list:
+        gefaehrdungen = {}
+        for anf in self.get_anforderungen_by_baustein(name):
+            for link in self._links_by_anforderung.get(anf, []):
+                gefaehrdungen.setdefault(link.gefaehrdung, None)
+
+        return list(gefaehrdungen)
+
+
+# load an edition only once per process (like data/2023)
+@lru_cache(maxsize=None)
+def _get_edition(path: str) -> Edition:
+    return Edition.from_directory(path)
+
+
+def get_edition(path: str) -> Edition:
+    return _get_edition(os.path.abspath(path))
@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+import resource
+import time
+from typing import Iterator, Optional
+
+
+# CPU time of this process (all threads) and its finished child
+# processes (like pdftohtml or parsing workers)
+def get_cpu_time() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+# highest peak RSS in bytes of this process before the last reset
+# (resetting VmHWM also resets ru_maxrss, see get_max_rss)
+_max_rss = 0
+
+
+# reset the peak RSS of this process to its current RSS (Linux only),
+# return False if not possible
+def reset_peak_rss() -> bool:
+    global _max_rss
+
+    _max_rss = max(_max_rss, get_peak_rss() or 0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+
+    return True
+
+
+# peak RSS in bytes of this process since the last reset_peak_rss
+# (VmHWM, Linux only), None if not available
+def get_peak_rss() -> Optional[int]:
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+# highest RSS in bytes this process and the largest finished child
+# process reached since their start (ru_maxrss is in KiB on Linux),
+# a process-wide high-water mark, not per stage or edition
+# (includes the peaks before every reset_peak_rss)
+def get_max_rss() -> dict:
+    current = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return {
+        'self': max(_max_rss, get_peak_rss() or 0, current),
+        'children':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+
+# wall time, CPU time, peak RSS and number of items per stage
+# (like download, pdftohtml or validation) of a run,
+# peak RSS of a stage (and of the whole run) is measured by resetting
+# the peak RSS of the process when a stage starts, where this is not
+# possible, it is the process-wide high-water mark (see get_max_rss)
+class Stats(object):
+    def __init__(self) -> None:
+        self.stages = {}
+        # peak RSS of the open stages (by a running number, stages of
+        # generators may end in any order) and of the whole run (key 0)
+        self._peaks = {}
+        self._count = 0
+        self._peaks[0] = self._start_peak()
+
+    def _update_peaks(self) -> None:
+        peak = get_peak_rss()
+        if peak is None:
+            peak = get_max_rss()['self']
+        for key, value in self._peaks.items():
+            self._peaks[key] = max(value, peak)
+
+    # remember the peak so far for all open stages, then reset it
+    def _start_peak(self) -> int:
+        if len(self._peaks) > 0:
+            self._update_peaks()
+        reset_peak_rss()
+
+        return get_peak_rss() or 0
+
+    # measure a stage, the yielded dict takes the number of items
+    # (like stage['items'] = 42), repeated stages are summed up
+    # (peak RSS is the maximum of all calls)
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        record = {'items': 0}
+        wall = time.perf_counter()
+        cpu = get_cpu_time()
+        self._count += 1
+        key = self._count
+        self._peaks[key] = self._start_peak()
+        try:
+            yield record
+        finally:
+            self._update_peaks()
+            peak = self._peaks.pop(key)
+            entry = self.stages.setdefault(name, {'calls': 0,
+                                                  'items': 0,
+                                                  'wall_time': 0.0,
+                                                  'cpu_time': 0.0,
+                                                  'peak_rss': 0})
+            entry['calls'] += 1
+            entry['items'] += record['items']
+            entry['wall_time'] += time.perf_counter() - wall
+            entry['cpu_time'] += get_cpu_time() - cpu
+            entry['peak_rss'] = max(entry['peak_rss'], peak)
+
+    def to_dict(self) -> dict:
+        self._update_peaks()
+
+        return {'stages': self.stages,
+                'wall_time': sum(x['wall_time'] for x in self.stages.values()),
+                'cpu_time': sum(x['cpu_time'] for x in self.stages.values()),
+                'peak_rss': self._peaks[0],
+                'max_rss': get_max_rss()}
@@ -0,0 +1,94 @@
+import json
+import os
+
+# jsonschema is imported on first use (it takes a while to load)
+
+# references between the json files (file, attribute, referenced file),
+# an attribute may be a single ID or a list of IDs
+REFERENCES = [
+    ('anforderung', 'anforderungstyp', 'anforderungstyp'),
+    ('anforderung', 'baustein', 'baustein'),
+    ('anforderung', 'rollen', 'rolle'),
+    ('anforderung_gefaehrdung', 'anforderung', 'anforderung'),
+    ('anforderung_gefaehrdung', 'gefaehrdung', 'gefaehrdung'),
+    ('anforderung_gefaehrdung', 'schutzziele', 'schutzziel'),
+    ('baustein', 'bausteinkategorie', 'bausteinkategorie'),
+    ('baustein', 'rolle', 'rolle'),
+]
+
+# compiled validators per schema file (kept for the whole process)
+_validators = {}
+
+
+# hashable representation of json data, equal if the data is equal
+# in terms of json schema (1 == 1.0, but true != 1)
+def _freeze(data):
+    if isinstance(data, dict):
+        return frozenset((k, _freeze(v)) for k, v in data.items())
+    if isinstance(data, list):
+        return tuple(_freeze(x) for x in data)
+    if isinstance(data, bool):
+        return 'bool', data
+
+    return data
+
+
+# same as the default "uniqueItems", but with a set instead of
+# comparing every item with every other item
+def _unique_items(validator, unique, instance, schema):
+    if unique and validator.is_type(instance, 'array'):
+        if len(set(_freeze(x) for x in instance)) != len(instance):
+            from jsonschema import ValidationError
+
+            yield ValidationError(
+                '{!r} has non-unique elements'.format(instance))
+
+
+def get_validator(schema_path: str):
+    schema_path = os.path.abspath(schema_path)
+    if schema_path not in _validators:
+        from jsonschema.validators import extend, validator_for
+
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+
+        cls = validator_for(schema)
+        # check the schema only once
+        cls.check_schema(schema)
+        cls = extend(cls, {'uniqueItems': _unique_items})
+        _validators[schema_path] = cls(schema)
+
+    return _validators[schema_path]
+
+
+def validate_data(data: list, schema_path: str) -> None:
+    from jsonschema.exceptions import best_match
+
+    error = best_match(get_validator(schema_path).iter_errors(data))
+    if error is not None:
+        raise error
+
+
+# check that all referenced IDs exist, data is a dict of
+# name (like "anforderung") -> list of elements
+def check_references(data: dict) -> None:
+    ids = {}
+    for name, elements in data.items():
+        ids[name] = set(x['id'] for x in elements)
+
+    errors = []
+    for name, attr, target in REFERENCES:
+        if name not in data or target not in ids:
+            continue
+        for elem in data[name]:
+            values = elem.get(attr)
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                if value not in ids[target]:
+                    errors.append('{} {}: {} {} does not exist'.format(
+                        name, elem['id'], attr, value))
+
+    if len(errors) > 0:
+        raise ValueError('Broken references:\n{}'.format(
+            '\n'.join('  {}'.format(x) for x in errors)))
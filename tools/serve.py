@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# serve converted editions (data/<edition>) as json over http, like
+# /2023/baustein/APP.1.1/gefaehrdungen, all responses are computed
+# once at startup (with strong ETags for conditional requests)
+import argparse
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from urllib.parse import unquote, urlsplit
+
+from lib.common import DATA_DIR, get_converted_editions
+from lib.query import Edition
+
+
+def _get_anforderungen(records: list) -> list:
+    return [x.to_dict() for x in records]
+
+
+# related records per kind: (kind, path suffix, function(edition, name))
+RELATIONS = [
+    ('anforderung', 'gefaehrdungen',
+     lambda edition, name: [
+         dict(gef.to_dict(), schutzziele=[x.name for x in schutzziele])
+         for gef, schutzziele in edition.get_gefaehrdungen_by_anforderung(
+             name)]),
+    ('anforderungstyp', 'anforderungen',
+     lambda edition, name: _get_anforderungen(
+         edition.get_anforderungen_by_anforderungstyp(name))),
+    ('baustein', 'anforderungen',
+     lambda edition, name: _get_anforderungen(
+         edition.get_anforderungen_by_baustein(name))),
+    ('baustein', 'gefaehrdungen',
+     lambda edition, name: [
+         x.to_dict() for x in edition.get_gefaehrdungen_by_baustein(name)]),
+    ('gefaehrdung', 'anforderungen',
+     lambda edition, name: _get_anforderungen(
+         edition.get_anforderungen_by_gefaehrdung(name))),
+    ('rolle', 'anforderungen',
+     lambda edition, name: _get_anforderungen(
+         edition.get_anforderungen_by_rolle(name))),
+]
+
+
+# response body and ETag of all paths of all editions
+def get_responses(editions: dict) -> dict:
+    responses = {}
+
+    def add(path: str, data) -> None:
+        body = json.dumps(data, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest())
+        responses[path] = (body, etag)
+
+    add('/', sorted(editions))
+    for name, edition in editions.items():
+        add('/{}'.format(name), edition.kinds)
+        for kind in edition.kinds:
+            records = edition.get_all(kind)
+            add('/{}/{}'.format(name, kind), [x.to_dict() for x in records])
+            for record in records:
+                add('/{}/{}/{}'.format(name, kind, record.name),
+                    record.to_dict())
+        for kind, suffix, get_related in RELATIONS:
+            for record in edition.get_all(kind):
+                add('/{}/{}/{}/{}'.format(name, kind, record.name, suffix),
+                    get_related(edition, record.name))
+
+    return responses
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # keep connections open
+    protocol_version = 'HTTP/1.1'
+    # path -> (body, etag), see get_responses
+    precomputed = {}
+
+    def do_GET(self) -> None:
+        self._respond(with_body=True)
+
+    def do_HEAD(self) -> None:
+        self._respond(with_body=False)
+
+    def _respond(self, with_body: bool) -> None:
+        path = unquote(urlsplit(self.path).path)
+        if len(path) > 1:
+            path = path.rstrip('/')
+
+        response = self.precomputed.get(path)
+        if response is None:
+            body = json.dumps({'error': 'Not found: {}'.format(path)},
+                              ensure_ascii=False).encode('utf-8')
+            self.send_response(404)
+            self.send_header('Content-Type',
+                             'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+            return
+
+        body, etag = response
+        if_none_match = self.headers.get('If-None-Match', '')
+        if etag in [x.strip() for x in if_none_match.split(',')] or \
+                if_none_match.strip() == '*':
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        # clients may cache, but have to ask again (cheap with the ETag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+
+def main() -> None:
+    editions = get_converted_editions()
+    parser = argparse.ArgumentParser(
+        description='Serve converted editions as json over http')
+    parser.add_argument(
+        '--editions',
+        type=lambda x: [y.strip() for y in x.split(',')],
+        default=editions,
+        help='comma separated list of editions (default: all, {})'.format(
+            ','.join(editions)))
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8080,
+        help='port to listen on (default: 8080)')
+    args = parser.parse_args()
+
+    for edition in args.editions:
+        if edition not in editions:
+            parser.error('unknown edition: {}'.format(edition))
+
+    RequestHandler.precomputed = get_responses({
+        x: Edition.from_directory(os.path.join(DATA_DIR, x))
+        for x in args.editions})
+    print('Serving {} responses of {} on http://{}:{}/'.format(
+        len(RequestHandler.precomputed), ', '.join(args.editions),
+        args.host, args.port))
+
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()